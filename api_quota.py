@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+
+from dhl_shipment_status_checker import get_seconds_from_time_string
+from shipment_storage import FileLock
+
+"""
+keeps track of api calls, so a big refresh can't use up the whole daily limit of the api-key
+
+hard limit: daily_limit calls per day (local date)
+token bucket: calls are spread over the day - bucket holds at most burst tokens,
+              refilled with daily_limit tokens per 24h
+state is saved to a json file after every call, so it survives restarts
+several processes can share the state file - it is locked, reloaded and saved for every call
+"""
+
+default_state_filename = "api_quota.json"
+
+stale_days = 14  # shipments without news for this long have lowest priority
+
+
+class ApiQuotaTracker:
+    def __init__(self, daily_limit=250, burst=None, state_filename=default_state_filename):
+        self.daily_limit = daily_limit
+        self.burst = burst if burst is not None else max(1, daily_limit // 2)
+        self.refill_rate = daily_limit / (24 * 60 * 60)  # tokens per second
+        self.state_filename = state_filename
+        self.lock = threading.Lock()
+
+        self.day = ""
+        self.calls = 0
+        self.tokens = float(self.burst)
+        self.last_refill = time.time()
+        self.load()
+
+    def load(self):
+        if os.path.isfile(self.state_filename):
+            with open(self.state_filename, "r") as openfile:
+                state = json.load(openfile)
+            self.day = state["day"]
+            self.calls = state["calls"]
+            self.tokens = min(float(self.burst), state["tokens"])
+            self.last_refill = state["last_refill"]
+
+    def save(self):
+        state = {"day": self.day, "calls": self.calls, "tokens": self.tokens, "last_refill": self.last_refill}
+        tmp_filename = f"{self.state_filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as outfile:
+            json.dump(state, outfile)
+        os.replace(tmp_filename, self.state_filename)
+
+    def refill(self, now):
+        today = time.strftime("%Y-%m-%d", time.localtime(now))
+        if today != self.day:
+            # new day - full budget
+            self.day = today
+            self.calls = 0
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        # True and call is recorded if budget allows one more call
+        with self.lock, FileLock(self.state_filename + ".lock"):
+            self.load()  # calls of other processes
+            self.refill(time.time())
+            if self.calls >= self.daily_limit or self.tokens < 1:
+                return False
+
+            self.calls += 1
+            self.tokens -= 1
+            self.save()
+            return True
+
+    def remaining(self):
+        # [calls left today, calls possible right now]
+        with self.lock:
+            self.refill(time.time())
+            left_today = max(0, self.daily_limit - self.calls)
+            return [left_today, min(left_today, int(self.tokens))]
+
+    def get_query_priority(self, shipment, now=None):
+        # lower is more important
+        #  0: newly added (never queried since adding), 1: in transit, 2: stale or other
+        if now is None:
+            now = time.time()
+
+        if shipment.last_query == shipment.added:
+            return 0
+
+        if len(shipment.events) > 0 and shipment.events[0].status_code in ["pre-transit", "transit"]:
+            try:
+                idle_days = (now - get_seconds_from_time_string(shipment.last_update)) / (24 * 60 * 60)
+            except ValueError:
+                idle_days = 0
+            if idle_days < stale_days:
+                return 1
+
+        return 2
+
+    def get_report_string(self):
+        left_today, available_now = self.remaining()
+        return f"api quota: {self.calls}/{self.daily_limit} calls used today, " \
+               f"{left_today} left ({available_now} available now)"
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+from benchmark_event_memory import make_response_text, measure_event_memory
+from dhl_api_stub import DhlApiStubServer, make_shipment_response
+from dhl_api_transport import DhlApiTransport
+from dhl_shipment_status_checker import DhlShipmentChecker, ShipmentDescriptor, compact_response, get_time_string
+from shipment_storage import JsonFileStorage
+
+"""
+benchmarks with synthetic shipments (N shipments x M events) and local api stub
+results are written as json, eg to compare against results of an older version
+
+    python benchmark.py --shipments 1000 --events 30 --latency 0.05 --output bench.json
+
+timed
+    load            DhlShipmentChecker start (file read, headers only)
+    load_events     load + parse all events
+    diff_unchanged  status_has_changed for every shipment, reply without news
+    diff_changed    status_has_changed for every shipment, reply with one new event
+    save            overwrite_json_file
+    render          get_status_string for every shipment (nothing cached)
+    refresh         update_all_shipment_statuses against local stub (with latency)
+"""
+
+
+def make_tracking_number(i):
+    return f"JJD{i:012d}"
+
+def generate_tracked_shipments(filename, no_shipments, no_events):
+    # tracked shipments file as written by JsonFileStorage
+    now = get_time_string()
+    shipments_json = []
+    for i in range(no_shipments):
+        tracking_number = make_tracking_number(i)
+        response = make_shipment_response(tracking_number, no_events)
+        shipments_json.append({
+            "trackingNumber": tracking_number,
+            "name": f"shipment {i}",
+            "added": now,
+            "last_query": now,
+            "last_update": now,
+            "status_raw": compact_response(response["shipments"][0]),
+        })
+
+    JsonFileStorage(filename).write_json_atomic(shipments_json)
+
+def make_checker(filename, transport=None, max_parallel_requests=8):
+    if transport is None:
+        transport = DhlApiTransport("benchmark")
+    return DhlShipmentChecker("benchmark", max_parallel_requests=max_parallel_requests,
+                              storage=JsonFileStorage(filename), transport=transport)
+
+def time_function(function, repeat, setup=None):
+    # function(setup result) is timed, setup is not
+    times = []
+    for i in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "mean": sum(times) / len(times), "runs": times}
+
+
+def run_benchmarks(no_shipments, no_events, latency, repeat, max_parallel_requests, measure_memory):
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "tracked_shipments.json")
+        generate_tracked_shipments(filename, no_shipments, no_events)
+        results["file_size"] = os.path.getsize(filename)
+
+        results["load"] = time_function(lambda _: make_checker(filename), repeat)
+
+        def load_events(_):
+            for shipment in make_checker(filename).shipments:
+                shipment.events
+
+        results["load_events"] = time_function(load_events, repeat)
+
+        # replies as received from api, same events / one new event
+        unchanged_replies = [json.dumps(make_shipment_response(make_tracking_number(i), no_events))
+                             for i in range(no_shipments)]
+        changed_replies = [json.dumps(make_shipment_response(make_tracking_number(i), no_events + 1))
+                           for i in range(no_shipments)]
+
+        def loaded_checker():
+            checker = make_checker(filename)
+            for shipment in checker.shipments:
+                shipment.events
+            return checker
+
+        def diff(replies):
+            def function(checker):
+                for shipment, reply in zip(checker.shipments, replies):
+                    shipment.status_has_changed(reply)
+            return function
+
+        results["diff_unchanged"] = time_function(diff(unchanged_replies), repeat, loaded_checker)
+        results["diff_changed"] = time_function(diff(changed_replies), repeat, loaded_checker)
+
+        results["save"] = time_function(lambda checker: checker.overwrite_json_file(), repeat, loaded_checker)
+
+        def render(checker):
+            for shipment in checker.shipments:
+                shipment.get_status_string()
+
+        results["render"] = time_function(render, repeat, loaded_checker)
+
+        # full run: network (stub), diffing and one write
+        stub = DhlApiStubServer(latency=latency, no_events=no_events + 1).start()
+        try:
+            def refresh_checker():
+                generate_tracked_shipments(filename, no_shipments, no_events)
+                transport = DhlApiTransport("benchmark", stub.base_url, pool_size=max(10, max_parallel_requests))
+                return make_checker(filename, transport, max_parallel_requests)
+
+            results["refresh"] = time_function(lambda checker: checker.update_all_shipment_statuses(),
+                                               repeat, refresh_checker)
+        finally:
+            stub.stop()
+
+    if measure_memory:
+        response_text = make_response_text(no_shipments, no_events)
+        no_measured, size = measure_event_memory(response_text, ShipmentDescriptor.EventDescriptor)
+        results["event_memory_bytes"] = size / no_measured
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark tracker with synthetic shipments and local api stub")
+    parser.add_argument("--shipments", type=int, default=500)
+    parser.add_argument("--events", type=int, default=20, help="events per shipment")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stub response")
+    parser.add_argument("--parallel", type=int, default=8, help="max number of parallel requests in refresh")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory", action="store_true", help="also measure memory per event")
+    parser.add_argument("--output", default=None, help="write json results to file (default: stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "parameters": {"shipments": args.shipments, "events": args.events, "latency": args.latency,
+                       "parallel": args.parallel, "repeat": args.repeat},
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": run_benchmarks(args.shipments, args.events, args.latency, args.repeat,
+                                  args.parallel, args.memory),
+    }
+
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as outfile:
+            json.dump(report, outfile, indent=4)
+        for name, result in report["results"].items():
+            if type(result) == dict:
+                print(f"{name:<16} {result['best'] * 1000:10.1f} ms")
+            else:
+                print(f"{name:<16} {result:10.1f}")
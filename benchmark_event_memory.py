@@ -0,0 +1,62 @@
+import argparse
+import gc
+import json
+import tracemalloc
+
+from dhl_api_stub import make_shipment_response
+from dhl_shipment_status_checker import ShipmentDescriptor
+
+"""
+memory per event: EventDescriptor as it used to be (normal __dict__, raw json kept, no interning)
+compared to current EventDescriptor (__slots__, interned strings, raw json not kept)
+
+    python benchmark_event_memory.py --shipments 1000 --events 30
+"""
+
+
+# EventDescriptor before __slots__/interning - for comparison only
+class OldEventDescriptor:
+    def __init__(self, event_json):
+        self.raw_json = event_json
+        self.timestamp = self.raw_json["timestamp"]
+        self.status_code = self.raw_json["statusCode"]
+        self.status = self.raw_json["status"]
+        self.status_desc = self.raw_json["description"]
+        if self.status == self.status_desc:
+            self.status_desc = ""
+
+
+def make_response_text(no_shipments, no_events):
+    # one string, so every event gets its own freshly parsed strings - like loading from file
+    return json.dumps([make_shipment_response(f"JJD{i:012d}", no_events)["shipments"][0]
+                       for i in range(no_shipments)])
+
+def measure_event_memory(response_text, make_event):
+    # bytes still allocated after building all events and dropping everything else
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+
+    shipments_json = json.loads(response_text)
+    events = [make_event(event_json) for shipment_json in shipments_json for event_json in shipment_json["events"]]
+    del shipments_json
+    gc.collect()
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return [len(events), current - start]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="memory per event before and after compact EventDescriptor")
+    parser.add_argument("--shipments", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=30, help="events per shipment")
+    args = parser.parse_args()
+
+    response_text = make_response_text(args.shipments, args.events)
+
+    for name, make_event in [["before (dict, raw json)", OldEventDescriptor],
+                             ["after (slots, interned)", ShipmentDescriptor.EventDescriptor]]:
+        no_events, size = measure_event_memory(response_text, make_event)
+        print(f"{name:<25} {no_events} events {size / 1024 / 1024:8.2f} MiB {size / no_events:8.1f} bytes/event")
@@ -0,0 +1,69 @@
+import csv
+import json
+import os
+import sys
+
+"""
+read tracking numbers (and optional names) for DhlShipmentChecker.add_tracked_shipments
+
+csv     header with column "trackingNumber" (or "tracking_number", "number") and optional "name",
+        or no header: first column number, second column name
+jsonl   one object per line {"trackingNumber": ..., "name": ...} or just the number as json string
+"-" reads csv from stdin
+"""
+
+number_columns = ["trackingnumber", "tracking_number", "number"]
+
+
+def read_tracking_numbers(filename):
+    # returns [[tracking_number, name], ...], empty lines are skipped
+    if filename == "-":
+        return read_csv(sys.stdin)
+
+    with open(filename, "r", encoding="utf-8", newline="") as openfile:
+        if os.path.splitext(filename)[1].lower() in [".jsonl", ".ndjson"]:
+            return read_jsonl(openfile)
+        return read_csv(openfile)
+
+def read_csv(openfile):
+    rows = [row for row in csv.reader(openfile) if len(row) > 0 and row[0].strip() != ""]
+    if len(rows) == 0:
+        return []
+
+    header = [column.strip().lower() for column in rows[0]]
+    number_index = None
+    for column in number_columns:
+        if column in header:
+            number_index = header.index(column)
+            break
+
+    if number_index is None:
+        # no header
+        number_index, name_index = 0, 1
+    else:
+        name_index = header.index("name") if "name" in header else None
+        rows = rows[1:]
+
+    result = []
+    for row in rows:
+        name = ""
+        if name_index is not None and name_index < len(row):
+            name = row[name_index].strip()
+        if number_index < len(row) and row[number_index].strip() != "":
+            result.append([row[number_index].strip(), name])
+    return result
+
+def read_jsonl(openfile):
+    result = []
+    for line in openfile:
+        line = line.strip()
+        if line == "":
+            continue
+
+        entry = json.loads(line)
+        if type(entry) == str:
+            result.append([entry.strip(), ""])
+        else:
+            tracking_number = entry.get("trackingNumber", entry.get("tracking_number", entry.get("number", "")))
+            result.append([str(tracking_number).strip(), entry.get("name", "")])
+    return [entry for entry in result if entry[0] != ""]
@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+
+import requests
+
+from dhl_api_transport import LocalResponse
+
+"""
+record api traffic to a cassette file and replay it later - offline, deterministic runs with real responses
+
+RecordingTransport wraps a transport (eg DhlApiTransport) and appends every /track/shipments request with
+its response and duration to a json lines file
+ReplayTransport answers from such a file, without network, api-key or quota
+
+    python dhl_batch_cli.py --api-key KEY --record traffic.jsonl poll --all
+    python dhl_batch_cli.py --replay traffic.jsonl --replay-speed 0 poll --all
+
+replay speed: 1 - wait as long as the recorded request took, 10 - ten times faster, 0 - don't wait
+a tracking number queried several times gets the recorded responses in recorded order, then the last one again
+
+record: {"time", "trackingNumber", "service", "duration", "status_code", "reason", "headers", "text"}
+        or {"time", "trackingNumber", "service", "duration", "error"} if no response was received
+"""
+
+cassette_version = 1
+
+
+class RecordingTransport:
+    recorded_headers = ["Retry-After", "Content-Type"]
+
+    def __init__(self, transport, cassette_filename):
+        self.transport = transport
+        self.cassette_filename = cassette_filename
+        self.lock = threading.Lock()
+        # append-only, line buffered - every record is complete in the file as soon as the request is done
+        self.outfile = open(cassette_filename, "a", encoding="utf-8", buffering=1)
+
+    def get_shipment_status(self, tracking_number, service=None):
+        record = {"version": cassette_version, "time": time.time(), "trackingNumber": tracking_number,
+                  "service": service}
+        start = time.perf_counter()
+        try:
+            response = self.transport.get_shipment_status(tracking_number, service)
+        except requests.RequestException as e:
+            record["duration"] = time.perf_counter() - start
+            record["error"] = type(e).__name__
+            self.write_record(record)
+            raise
+
+        record["duration"] = time.perf_counter() - start
+        record["status_code"] = response.status_code
+        record["reason"] = response.reason
+        record["headers"] = {key: response.headers[key] for key in self.recorded_headers if key in response.headers}
+        record["text"] = response.text
+        self.write_record(record)
+        return response
+
+    def write_record(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.outfile.write(line)
+
+    def close(self):
+        with self.lock:
+            self.outfile.close()
+        self.transport.close()
+
+
+class ReplayTransport:
+    def __init__(self, cassette_filename, speed=1.0):
+        self.speed = speed  # 0 - no waiting
+        self.lock = threading.Lock()
+
+        # (tracking number, service) -> [records], tracking number -> [records] (any service)
+        self.records = {}
+        self.records_by_number = {}
+        self.next_index = {}
+        with open(cassette_filename, "r", encoding="utf-8") as openfile:
+            for line in openfile:
+                if line.strip() == "":
+                    continue
+                record = json.loads(line)
+                number = record["trackingNumber"].lower()
+                self.records.setdefault((number, record["service"]), []).append(record)
+                self.records_by_number.setdefault(number, []).append(record)
+
+    def get_shipment_status(self, tracking_number, service=None):
+        number = tracking_number.lower()
+        key = (number, service)
+        with self.lock:
+            records = self.records.get(key)
+            if records is None:
+                # eg service was resolved differently than when recording
+                records = self.records_by_number.get(number)
+                key = number
+            if records is None:
+                return LocalResponse(404, "not in cassette")
+            index = self.next_index.get(key, 0)
+            self.next_index[key] = index + 1
+            record = records[min(index, len(records) - 1)]
+
+        if self.speed > 0:
+            time.sleep(record["duration"] / self.speed)
+
+        if "error" in record:
+            raise requests.ConnectionError(f"recorded error: {record['error']}")
+        return LocalResponse(record["status_code"], record["reason"], record["text"], dict(record["headers"]))
+
+    def close(self):
+        pass
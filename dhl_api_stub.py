@@ -0,0 +1,196 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+"""
+local stand-in for the /track/shipments endpoint - no api-key or network needed
+
+answers every tracking number with a generated response (same shape as the real api), service "parcel-de"
+queries for other services get 404 unless a response was set for that service
+can simulate slow responses, rate limiting (429 with Retry-After) and server errors (5xx)
+
+    python dhl_api_stub.py --port 8080 --latency 0.2 --rate-429 0.1 --rate-5xx 0.05
+    then use DhlApiTransport(api_key, base_url="http://127.0.0.1:8080")
+"""
+
+status_texts = [
+    ("pre-transit", "The shipment has been electronically announced"),
+    ("transit", "The shipment has arrived at the parcel center of origin"),
+    ("transit", "The shipment has arrived at the export parcel center"),
+    ("transit", "Customs clearance process started"),
+    ("transit", "Customs clearance in progress"),
+    ("transit", "Customs clearance process completed"),
+    ("transit", "Shipment arrived in the recipient's region"),
+    ("transit", "Being delivered."),
+    ("delivered", "Delivery successful."),
+]
+
+
+def make_event(timestamp, status_code, status):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)),
+        "location": {"address": {"addressLocality": "Germany"}},
+        "statusCode": status_code,
+        "status": status,
+        "description": status,
+    }
+
+def make_shipment_response(tracking_number, no_events=3, service="parcel-de", delivered=False,
+                           start_time=1680000000):
+    # api-response with no_events events, one event per hour, newest first
+    events = []
+    for i in range(no_events):
+        if i == 0:
+            status_code, status = status_texts[0]
+        elif delivered and i == no_events - 1:
+            status_code, status = status_texts[-1]
+        else:
+            # cycle through transit statuses
+            status_code, status = status_texts[1 + (i - 1) % (len(status_texts) - 2)]
+        events.append(make_event(start_time + i * 3600, status_code, status))
+    events.reverse()
+
+    return {
+        "shipments": [{
+            "serviceUrl": f"https://www.dhl.de/de/privatkunden.html?piececode={tracking_number.upper()}",
+            "id": tracking_number.upper(),
+            "service": service,
+            "origin": {"address": {"countryCode": "JP"}},
+            "destination": {"address": {"countryCode": "DE"}},
+            "status": events[0],
+            "details": {"proofOfDeliverySignedAvailable": False, "totalNumberOfPieces": 1,
+                        "pieceIds": [tracking_number.upper()]},
+            "events": events,
+        }],
+        "possibleAdditionalShipmentsUrl": [
+            f"/track/shipments?trackingNumber={tracking_number.upper()}&service={other_service}"
+            for other_service in ["freight", "dgf", "ecommerce", "parcel-nl", "parcel-pl", "express"]
+        ],
+    }
+
+
+class DhlApiStubServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, latency_jitter=0.0,
+                 rate_429=0.0, retry_after=1, rate_5xx=0.0, no_events=3):
+        self.latency = latency  # seconds per response
+        self.latency_jitter = latency_jitter  # +- random seconds
+        self.rate_429 = rate_429  # share of requests answered with 429
+        self.retry_after = retry_after  # value of Retry-After header for 429 (None - no header)
+        self.rate_5xx = rate_5xx  # share of requests answered with 503
+        self.no_events = no_events
+
+        # responses for specific tracking numbers (lower case), others are generated
+        #  (tracking number, service) -> response for queries with service
+        self.responses = {}
+        self.service_responses = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True  # headers and body are separate writes - don't wait for ack
+
+            def do_GET(self):
+                stub.handle_get(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_response(self, tracking_number, response_json, service=None):
+        # service None - answer for queries without service
+        if service is None:
+            self.responses[tracking_number.lower()] = response_json
+        else:
+            self.service_responses[(tracking_number.lower(), service)] = response_json
+
+    def handle_get(self, handler):
+        with self.lock:
+            self.request_count += 1
+
+        delay = self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        url = urlparse(handler.path)
+        params = parse_qs(url.query)
+        if url.path != "/track/shipments" or "trackingNumber" not in params:
+            return self.send_json(handler, 404, {"status": 404, "title": "Not Found"})
+
+        if random.random() < self.rate_429:
+            headers = {}
+            if self.retry_after is not None:
+                headers["Retry-After"] = str(self.retry_after)
+            return self.send_json(handler, 429, {"status": 429, "title": "Too Many Requests"}, headers)
+
+        if random.random() < self.rate_5xx:
+            return self.send_json(handler, 503, {"status": 503, "title": "Service Unavailable"})
+
+        tracking_number = params["trackingNumber"][0]
+        service = params.get("service", [None])[0]
+        if service is not None and service != "parcel-de":
+            response = self.service_responses.get((tracking_number.lower(), service))
+        elif service is not None and (tracking_number.lower(), service) in self.service_responses:
+            response = self.service_responses[(tracking_number.lower(), service)]
+        else:
+            response = self.responses.get(tracking_number.lower())
+            if response is None:
+                response = make_shipment_response(tracking_number, self.no_events)
+        if response is None or len(response.get("shipments", [])) == 0:
+            return self.send_json(handler, 404, {"status": 404, "title": "No result found"})
+        self.send_json(handler, 200, response)
+
+    def send_json(self, handler, status_code, body, headers=None):
+        data = json.dumps(body).encode()
+        handler.send_response(status_code)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def start(self):
+        # serve in background thread
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="local stub for the DHL tracking api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--events", type=int, default=3, help="events per generated shipment")
+    args = parser.parse_args()
+
+    stub = DhlApiStubServer(args.host, args.port, args.latency, args.latency_jitter,
+                            args.rate_429, args.retry_after, args.rate_5xx, args.events)
+    print(f"serving on {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
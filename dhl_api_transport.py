@@ -0,0 +1,110 @@
+import email.utils
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+"""
+http access to DHL "Shipment Tracking - Unified" API
+
+one pooled session for all calls (keep-alive, no new tcp/tls handshake per call)
+timeouts for connect and read, retries with exponential backoff and jitter
+429 (rate limit) and 5xx are retried, waiting as long as "Retry-After" header says if present
+optional ApiQuotaTracker - every request (also retries) needs budget, else 429 is returned without calling api
+"""
+
+default_base_url = "https://api-eu.dhl.com"
+
+
+# stands in for requests.Response if no request could be made
+class LocalResponse:
+    def __init__(self, status_code, reason, text="", headers=None):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.headers = headers if headers is not None else {}
+        self.content = text.encode()
+
+
+class DhlApiTransport:
+    retry_status_codes = [429, 500, 502, 503, 504]
+
+    def __init__(self, api_key, base_url=default_base_url, connect_timeout=5, read_timeout=30,
+                 max_retries=3, backoff_factor=0.5, max_backoff=30, max_retry_after=120, pool_size=10,
+                 quota=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor  # first retry waits up to backoff_factor seconds, then doubled each time
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after  # don't wait longer than this, even if server asks to
+        self.quota = quota
+
+        # pool_size should be at least number of parallel requests, else connections are thrown away
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["DHL-API-Key"] = api_key
+
+    def get_shipment_status(self, tracking_number, service=None):
+        # ex
+        # curl -X GET 'https://api-eu.dhl.com/track/shipments?trackingNumber=7777777770' -H 'DHL-API-Key:PasteHere_ConsumerKey
+        params = {"trackingNumber": tracking_number}
+        if service is not None:
+            params["service"] = service
+
+        return self.get("/track/shipments", params)
+
+    def get(self, path, params):
+        # raises requests.RequestException if no response after all retries
+        url = self.base_url + path
+
+        attempt = 0
+        while True:
+            if self.quota is not None and not self.quota.try_acquire():
+                return LocalResponse(429, "daily api quota exhausted")
+
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.get_backoff_time(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code not in self.retry_status_codes or attempt >= self.max_retries:
+                return response
+
+            wait_time = self.get_retry_after(response)
+            if wait_time is None:
+                wait_time = self.get_backoff_time(attempt)
+            response.close()  # give connection back to pool
+
+            time.sleep(wait_time)
+            attempt += 1
+
+    def get_backoff_time(self, attempt):
+        # exponential backoff, "full jitter" - so parallel requests don't all retry at the same moment
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def get_retry_after(self, response):
+        # "Retry-After" is either seconds or a http-date
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+
+        return min(max(0.0, seconds), self.max_retry_after)
+
+    def close(self):
+        self.session.close()
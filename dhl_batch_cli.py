@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import sys
+
+from api_quota import ApiQuotaTracker
+from bulk_import import read_tracking_numbers
+from cassette_transport import RecordingTransport, ReplayTransport
+from dhl_api_transport import DhlApiTransport, default_base_url
+from dhl_shipment_status_checker import DhlShipmentChecker, already_tracked_reason
+from notification_bus import add_notification_arguments, make_notification_bus
+from polling_scheduler import PollingScheduler
+from response_cache import ResponseCache
+from service_resolver import ServiceResolver
+from shipment_storage import open_storage, default_json_filename
+from tracker_metrics import TrackerMetrics
+
+"""
+non-interactive commands for cron jobs and pipelines
+one json object per line on stdout, written as soon as it is available
+
+    python dhl_batch_cli.py --api-key KEY poll [--all]
+    python dhl_batch_cli.py --api-key KEY add 00340434161094042557 --name "new phone"
+    python dhl_batch_cli.py --api-key KEY import shipments.csv
+    python dhl_batch_cli.py remove 00340434161094042557
+    python dhl_batch_cli.py list [--status transit] [--country DE] [--idle-days 5]
+    python dhl_batch_cli.py show [tracking numbers]
+    python dhl_batch_cli.py --replay traffic.jsonl --replay-speed 0 poll --all
+
+api-key can also be given as environment variable DHL_API_KEY
+
+exit codes
+    0   success
+    1   at least one query failed / tracking number not found
+    2   bad arguments
+"""
+
+exit_ok = 0
+exit_failure = 1
+exit_usage = 2
+
+
+def write_json_line(obj):
+    sys.stdout.write(json.dumps(obj) + "\n")
+    sys.stdout.flush()
+
+def get_shipment_json(shipment, include_events=False):
+    shipment_json = {
+        "trackingNumber": shipment.tracking_number,
+        "name": shipment.name,
+        "added": shipment.added,
+        "last_query": shipment.last_query,
+        "last_update": shipment.last_update,
+    }
+    if include_events:
+        shipment_json["events"] = [event.to_json() for event in shipment.events]
+    else:
+        shipment_json["newest_event"] = shipment.events[0].to_json() if len(shipment.events) > 0 else None
+    return shipment_json
+
+def get_result_json(shipment, res):
+    # res as returned by DhlShipmentChecker.update_shipment_status
+    result_json = get_shipment_json(shipment)
+    result_json["http_status"] = res[0]
+    result_json["reason"] = res[1]
+    result_json["changed"] = res[2]
+    result_json["new_events"] = [event.to_json() for event in res[3]] if res[2] else []
+    return result_json
+
+def command_poll(checker, args):
+    failed = [False]
+
+    def write_result(index, shipment, res):
+        if res[0] != 200:
+            failed[0] = True
+        write_json_line(get_result_json(shipment, res))
+
+    if args.no_schedule:
+        checker.update_all_shipment_statuses(on_result=write_result, bypass_cache=args.refresh)
+    else:
+        schedule_filename = args.schedule if args.replay is None else None  # replay - schedule only in memory
+        PollingScheduler(schedule_filename).poll(checker, write_result, args.all, args.refresh)
+
+    return exit_failure if failed[0] else exit_ok
+
+def command_add(checker, args):
+    if checker.find_shipment(args.tracking_number) is not None:
+        write_json_line({"trackingNumber": args.tracking_number, "error": "already tracked"})
+        return exit_failure
+
+    status_code, reason, shipment = checker.add_tracked_shipment(args.tracking_number, args.name)
+    if shipment is None:
+        write_json_line({"trackingNumber": args.tracking_number, "http_status": status_code, "reason": reason})
+        return exit_failure
+
+    write_json_line(dict(get_shipment_json(shipment, True), http_status=status_code, reason=reason))
+    return exit_ok
+
+def command_import(checker, args):
+    # one line per tracking number, all accepted shipments are saved with a single write
+    new_shipments = read_tracking_numbers(args.file)
+    failed = [False]
+
+    def write_result(index, tracking_number, res):
+        result_json = {"trackingNumber": tracking_number, "name": new_shipments[index][1],
+                       "http_status": res[0], "reason": res[1], "added": res[2] is not None}
+        if res[2] is not None:
+            result_json["newest_event"] = res[2].events[0].to_json() if len(res[2].events) > 0 else None
+        elif res[1] != already_tracked_reason:
+            failed[0] = True  # duplicates are no failure, bad responses and failed requests are
+        write_json_line(result_json)
+
+    checker.add_tracked_shipments(new_shipments, on_result=write_result)
+
+    return exit_failure if failed[0] else exit_ok
+
+def command_remove(checker, args):
+    result = exit_ok
+    for tracking_number in args.tracking_numbers:
+        shipment = checker.find_shipment(tracking_number)
+        if shipment is None:
+            write_json_line({"trackingNumber": tracking_number, "error": "not tracked"})
+            result = exit_failure
+            continue
+
+        checker.delete_tracked_shipment(shipment, overwrite_file=False)
+        write_json_line({"trackingNumber": shipment.tracking_number, "removed": True})
+
+    checker.flush()
+    return result
+
+def command_list(checker, args):
+    for shipment in get_filtered_shipments(checker, args):
+        write_json_line(get_shipment_json(shipment))
+    return exit_ok
+
+def get_filtered_shipments(checker, args):
+    # all shipments if no filter is given
+    return checker.shipments.query(
+        status_code=args.status.split(",") if args.status is not None else None,
+        destination_country=args.country.split(",") if args.country is not None else None,
+        not_updated_for=args.idle_days * 24 * 60 * 60 if args.idle_days is not None else None)
+
+def command_show(checker, args):
+    if len(args.tracking_numbers) == 0:
+        for shipment in checker.shipments:
+            write_json_line(get_shipment_json(shipment, True))
+        return exit_ok
+
+    result = exit_ok
+    for tracking_number in args.tracking_numbers:
+        shipment = checker.find_shipment(tracking_number)
+        if shipment is None:
+            write_json_line({"trackingNumber": tracking_number, "error": "not tracked"})
+            result = exit_failure
+        else:
+            write_json_line(get_shipment_json(shipment, True))
+    return result
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="track DHL shipments without prompts, json lines output")
+    parser.add_argument("--api-key", default=os.environ.get("DHL_API_KEY", ""),
+                        help="default: environment variable DHL_API_KEY")
+    parser.add_argument("--storage", default=default_json_filename,
+                        help="storage file: *.json (default), *.db for sqlite, *.shards or *.journal directory")
+    parser.add_argument("--shards", default=None,
+                        help="only use these shards of a *.shards directory, eg 0,1,2 (one worker per group)")
+    parser.add_argument("--parallel", type=int, default=8, help="max number of parallel requests")
+    parser.add_argument("--daily-limit", type=int, default=250, help="max api calls per day")
+    parser.add_argument("--burst", type=int, default=None)
+    parser.add_argument("--api-url", default=default_base_url, help="eg local stub, see dhl_api_stub.py")
+    parser.add_argument("--dummy", action="store_true", help="don't call api (for testing)")
+    parser.add_argument("--record", default=None, help="append api requests and responses to this cassette file")
+    parser.add_argument("--replay", default=None,
+                        help="answer api requests from this cassette file, no network (see cassette_transport.py), "
+                             "without response cache and schedule state of other runs")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="1 - recorded latency, 10 - ten times faster, 0 - no waiting")
+    parser.add_argument("--response-cache", default="response_cache.json",
+                        help="file for recent api responses, \"\" - no cache")
+    parser.add_argument("--metrics", default=None,
+                        help="write metrics when done: *.prom (prometheus text) or *.json")
+    add_notification_arguments(parser)  # console notifications go to stderr
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_poll = subparsers.add_parser("poll", help="query tracked shipments")
+    parser_poll.add_argument("--all", action="store_true", help="query all shipments, not only due ones")
+    parser_poll.add_argument("--no-schedule", action="store_true",
+                             help="query all shipments and don't update schedule")
+    parser_poll.add_argument("--schedule", default="polling_schedule.json", help="schedule state file")
+    parser_poll.add_argument("--refresh", action="store_true",
+                             help="query api even for shipments with a recent response in the response cache")
+    parser_poll.set_defaults(function=command_poll, needs_api=True)
+
+    parser_add = subparsers.add_parser("add", help="start tracking a shipment")
+    parser_add.add_argument("tracking_number")
+    parser_add.add_argument("--name", default="")
+    parser_add.set_defaults(function=command_add, needs_api=True)
+
+    parser_import = subparsers.add_parser("import", help="start tracking many shipments from csv or jsonl file")
+    parser_import.add_argument("file", help="*.csv, *.jsonl or - (csv from stdin), see bulk_import.py")
+    parser_import.set_defaults(function=command_import, needs_api=True)
+
+    parser_remove = subparsers.add_parser("remove", help="stop tracking shipments")
+    parser_remove.add_argument("tracking_numbers", nargs="+")
+    parser_remove.set_defaults(function=command_remove, needs_api=False)
+
+    parser_list = subparsers.add_parser("list", help="tracked shipments with newest event")
+    parser_list.add_argument("--status", default=None,
+                             help="only with this status code of newest event, eg transit or pre-transit,transit")
+    parser_list.add_argument("--country", default=None, help="only with this destination country code, eg DE")
+    parser_list.add_argument("--idle-days", type=float, default=None, help="only without update for this many days")
+    parser_list.set_defaults(function=command_list, needs_api=False)
+
+    parser_show = subparsers.add_parser("show", help="tracked shipments with all events")
+    parser_show.add_argument("tracking_numbers", nargs="*", help="default: all")
+    parser_show.set_defaults(function=command_show, needs_api=False)
+
+    return parser
+
+def main(argv=None):
+    parser = get_argument_parser()
+    args = parser.parse_args(argv)
+
+    if args.needs_api and args.api_key == "" and not args.dummy and args.replay is None:
+        print("ERROR: api-key must be given with --api-key or DHL_API_KEY", file=sys.stderr)
+        return exit_usage
+
+    response_cache = ResponseCache(args.response_cache) if args.response_cache != "" else None
+    if args.replay is not None:
+        # no quota, service cache, response cache or schedule file - every query is answered from cassette,
+        #  replay doesn't depend on (or change) state of earlier runs
+        quota = None
+        response_cache = None
+        transport = ServiceResolver(ReplayTransport(args.replay, args.replay_speed), cache_filename=None)
+    else:
+        quota = ApiQuotaTracker(args.daily_limit, args.burst)
+        transport = DhlApiTransport(args.api_key, args.api_url, pool_size=max(10, args.parallel), quota=quota)
+        if args.record is not None:
+            transport = RecordingTransport(transport, args.record)
+        transport = ServiceResolver(transport)
+    shards = None
+    if args.shards is not None:
+        try:
+            shards = [int(shard) for shard in args.shards.split(",")]
+        except ValueError:
+            print(f"ERROR: --shards must be comma separated numbers, got \"{args.shards}\"", file=sys.stderr)
+            return exit_usage
+
+    metrics = TrackerMetrics() if args.metrics is not None else None
+    notification_bus = make_notification_bus(args, sys.stderr)
+    checker = DhlShipmentChecker(args.api_key, args.dummy, args.parallel, storage=open_storage(args.storage, shards),
+                                 transport=transport, quota=quota, metrics=metrics,
+                                 response_cache=response_cache,
+                                 notification_bus=notification_bus)
+    try:
+        return args.function(checker, args)
+    finally:
+        checker.flush()
+        checker.storage.close()
+        checker.transport.close()
+        if notification_bus is not None:
+            notification_bus.close()
+        if metrics is not None:
+            metrics.write(args.metrics)
+
+
+if __name__ == '__main__':
+    exit(main())
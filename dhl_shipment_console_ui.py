@@ -1,7 +1,10 @@
+import sys
+
 import colorama
 from colorama import Fore, Back, Style
 
-from dhl_shipment_status_checker import DhlShipmentChecker
+from dhl_shipment_status_checker import DhlShipmentChecker, get_time_string
+from polling_scheduler import PollingScheduler
 
 """
 TODO
@@ -9,15 +12,26 @@ bad handling of inputs
 eg make function for "(y/n):" checks
 """
 class DhlShipmentConsoleUi:
-    def __init__(self, api_key, dummy_calls=False):
+    def __init__(self, api_key, dummy_calls=False, max_parallel_requests=8, storage=None, scheduler=None,
+                 quota=None, metrics=None, metrics_filename=None, response_cache=None, notification_bus=None,
+                 transport=None):
         colorama.init()
         self.no_shipments = 0
-        self.status_checker = DhlShipmentChecker(api_key, dummy_calls)
+        self.no_queries = 0
+        self.no_finished = 0
+        self.max_parallel_requests = max_parallel_requests
+        self.status_checker = DhlShipmentChecker(api_key, dummy_calls, max_parallel_requests,
+                                                 storage=storage, transport=transport, quota=quota, metrics=metrics,
+                                                 response_cache=response_cache, notification_bus=notification_bus)
+        # metrics are written after every refresh run (*.prom or json)
+        self.metrics_filename = metrics_filename
+        # None - always query all shipments
+        self.scheduler = scheduler
 
     def __del__(self):
         colorama.deinit()
 
-    def start(self):
+    def start(self, query_all=False, bypass_cache=False):
         shipments = self.status_checker.shipments
         self.no_shipments = self.status_checker.get_num_tracked_shipments()
         print(Back.WHITE + Fore.BLACK, end="")
@@ -27,29 +41,33 @@ class DhlShipmentConsoleUi:
         if self.no_shipments == 0:
             return self.ask_for_further_actions()
 
-        some_changes = False
-        changes = []
+        # query in parallel - print short result line as soon as each query finishes
+        #  detailed statuses are printed afterwards in original order
+        results = self.query_shipments(query_all, bypass_cache)
+        self.write_metrics()
 
-        for i, shipment in enumerate(shipments):
-            if shipment.name != "":
-                name = f"({shipment.name}) "
-            else:
-                name = ""
+        print("\n" + Back.WHITE + Fore.BLACK, "----- summary -----", Style.RESET_ALL)
 
-            print(f"... querying shipment {Fore.YELLOW}\"{shipment.tracking_number}\" {name}{Style.RESET_ALL}({i+1}/{self.no_shipments})\t", end="", flush=True)
-            res = self.status_checker.update_shipment_status(shipment)
+        some_changes = False
+        for shipment, res in zip(shipments, results):
+            if res is None:
+                # not due according to scheduler
+                print(f"{Fore.YELLOW}\"{shipment.tracking_number}\" {self.get_name_string(shipment)}{Style.RESET_ALL}"
+                      f"[not queried - not due]")
+                print(Back.WHITE + Fore.BLACK, "Newest known status:", Style.RESET_ALL)
+                print(shipment.events[0].get_nice_string())
+                continue
 
             success = res[0] == 200
-            some_changes = res[2]
 
+            print(f"{Fore.YELLOW}\"{shipment.tracking_number}\" {self.get_name_string(shipment)}{Style.RESET_ALL}", end="")
             if success:
                 print(Back.GREEN, end="")
             else:
                 print(Back.RED, end="")  # red background
-
             print(f"[{res[0]} - {res[1]}]" + Style.RESET_ALL)
 
-            if success and some_changes:
+            if success and res[2]:
                 some_changes = True
 
                 print(Back.BLUE, "New Status:", Style.RESET_ALL)
@@ -65,53 +83,145 @@ class DhlShipmentConsoleUi:
         if not some_changes:
             print(Fore.CYAN + ">>> no updates in status")
 
+        self.print_quota()
+
         print(Style.RESET_ALL, end="")  # reset background
 
         return self.ask_for_further_actions()
 
+    def query_shipments(self, query_all=False, bypass_cache=False):
+        # returns results in order of tracked shipments, None for shipments that were not due
+        self.no_finished = 0
+        if self.scheduler is None:
+            self.no_queries = self.no_shipments
+            return self.status_checker.update_all_shipment_statuses(self.max_parallel_requests,
+                                                                    self.print_query_result_line,
+                                                                    bypass_cache=bypass_cache)
+
+        if query_all:
+            self.no_queries = self.no_shipments
+        else:
+            self.no_queries = len(self.scheduler.get_due_shipments(self.status_checker.shipments))
+        print(f"querying {self.no_queries} shipment(s) that are due")
+
+        queried, queried_results = self.scheduler.poll(self.status_checker, self.print_query_result_line, query_all,
+                                                       bypass_cache)
+        results_by_shipment = {id(shipment): res for shipment, res in zip(queried, queried_results)}
+        return [results_by_shipment.get(id(shipment)) for shipment in self.status_checker.shipments]
+
+    def start_daemon(self):
+        # query due shipments forever, Ctrl+C to stop
+        if self.scheduler is None:
+            self.scheduler = PollingScheduler()
+
+        def print_idle(sleep_time):
+            print(f"[{get_time_string()}] next query in {int(sleep_time)}s", flush=True)
+            self.print_quota()
+            self.write_metrics()
+
+        try:
+            self.scheduler.run_daemon(self.status_checker, self.print_daemon_result_line, print_idle)
+        except KeyboardInterrupt:
+            print("exiting")
+            self.close_notification_bus()
+
+    def print_daemon_result_line(self, index, shipment, res):
+        if res[0] == 200:
+            print(Back.GREEN, end="")
+        else:
+            print(Back.RED, end="")  # red background
+        print(f"[{get_time_string()}] [{res[0]} - {res[1]}]{Style.RESET_ALL} "
+              f"{Fore.YELLOW}\"{shipment.tracking_number}\" {self.get_name_string(shipment)}{Style.RESET_ALL}", flush=True)
+        if res[2]:
+            for status in res[3]:
+                print(status.get_nice_string())
+
+    def print_quota(self):
+        quota = self.status_checker.quota
+        if quota is not None:
+            print(Style.RESET_ALL + Fore.CYAN + quota.get_report_string() + Style.RESET_ALL)
+
+    def close_notification_bus(self):
+        # notifications still queued are delivered before exiting
+        if self.status_checker.notification_bus is not None:
+            self.status_checker.notification_bus.close()
+
+    def write_metrics(self):
+        metrics = self.status_checker.metrics
+        if metrics is not None and self.metrics_filename is not None:
+            metrics.write(self.metrics_filename)
+
+    def get_name_string(self, shipment):
+        if shipment.name != "":
+            return f"({shipment.name}) "
+        return ""
+
+    def print_query_result_line(self, index, shipment, res):
+        self.no_finished += 1
+        print(f"... queried shipment {Fore.YELLOW}\"{shipment.tracking_number}\" {self.get_name_string(shipment)}{Style.RESET_ALL}"
+              f"({self.no_finished}/{self.no_queries})\t", end="")
+
+        if res[0] == 200:
+            print(Back.GREEN, end="")
+        else:
+            print(Back.RED, end="")  # red background
+
+        if res[2]:
+            changed = " - new status"
+        else:
+            changed = ""
+        print(f"[{res[0]} - {res[1]}]{changed}" + Style.RESET_ALL, flush=True)
+
     def print_spacing(self):
         print("-" * 40)
 
     def ask_for_further_actions(self):
-        self.print_spacing()
-        print("[1] print detailed statuses")
-        print("[2] track new shipment")
-        if self.no_shipments > 0:
-            print("[3] stop tracking a shipment")
-        print("[q/Enter] quit")
+        # loop until quit - dialogs return here when done
+        while True:
+            self.no_shipments = self.status_checker.get_num_tracked_shipments()
+
+            self.print_spacing()
+            print("[1] print detailed statuses")
+            print("[2] track new shipment")
+            if self.no_shipments > 0:
+                print("[3] stop tracking a shipment")
+                print("[4] list shipments by status")
+            print("[q/Enter] quit")
 
-        inp_str = input(">> ")
+            inp_str = input(">> ")
 
-        if inp_str == "1":
-            self.print_detailed_statuses()
-        elif inp_str == "2":
-            self.add_new_shipment_dialog()
-        elif inp_str == "3":
-            self.select_shipment_to_stop_tracking_dialog()
-        elif inp_str in ["q", ""]:
-            print("exiting")
-            exit(0)
-        else:
-            self.ask_for_further_actions()
+            if inp_str == "1":
+                self.print_detailed_statuses()
+            elif inp_str == "2":
+                self.add_new_shipment_dialog()
+            elif inp_str == "3" and self.no_shipments > 0:
+                self.select_shipment_to_stop_tracking_dialog()
+            elif inp_str == "4" and self.no_shipments > 0:
+                self.list_shipments_by_status_dialog()
+            elif inp_str in ["q", ""]:
+                print("exiting")
+                self.close_notification_bus()
+                exit(0)
 
     def print_detailed_statuses(self):
         shipments = self.status_checker.shipments
         no_shipments = len(shipments)
         if no_shipments == 0:
             print("nothing to show")
-            return self.ask_for_further_actions()
+            return
 
+        # one write per shipment, status strings are cached by the shipments
+        out = sys.stdout
         for i, shipment in enumerate(shipments):
             if shipment.name == "":
                 name = f"{shipment.tracking_number}"
             else:
                 name = f"{shipment.name} ({shipment.tracking_number})"
 
-            print(f"({i+1}/{no_shipments}) {name}")
-            print(shipment.get_status_string())
+            out.write(f"({i+1}/{no_shipments}) {name}\n{shipment.get_status_string()}\n")
+        out.flush()
 
         inp = input("\nPress Enter to continue...")
-        return self.ask_for_further_actions()
 
     def add_new_shipment_dialog(self):
         self.print_spacing()
@@ -125,12 +235,33 @@ class DhlShipmentConsoleUi:
 
             if conf_inp in ["n", "N"]:
                 print("aborting")
-                self.ask_for_further_actions()
+                return
             elif conf_inp in ["y", "Y", "j", "J"]:
                 return self.try_adding_new_shipment(tracking_number, name)
             else:
                 print("unknown input")
-        self.ask_for_further_actions()
+
+    def list_shipments_by_status_dialog(self):
+        self.print_spacing()
+        shipments = self.status_checker.shipments
+        status_codes = sorted(shipments.count_by_status_code().items())
+        for i, (status_code, count) in enumerate(status_codes):
+            print(f"[{i+1}] {status_code if status_code != '' else '(no events)'}: {count} shipment(s)")
+
+        inp_str = input(">> ")
+        try:
+            status_code = status_codes[int(inp_str) - 1][0]
+        except (ValueError, IndexError):
+            print("unknown input")
+            return
+
+        for shipment in shipments.query(status_code=status_code):
+            print(f"{Fore.YELLOW}\"{shipment.tracking_number}\" {self.get_name_string(shipment)}{Style.RESET_ALL}"
+                  f"last update {shipment.last_update}")
+            if len(shipment.events) > 0:
+                print(shipment.events[0].get_nice_string())
+
+        inp = input("\nPress Enter to continue...")
 
     def select_shipment_to_stop_tracking_dialog(self):
         self.print_spacing()
@@ -171,13 +302,15 @@ class DhlShipmentConsoleUi:
 
             if conf_inp in ["y", "Y", "j", "J"]:
                 self.status_checker.delete_tracked_shipment(shipment)
+                if self.scheduler is not None:
+                    self.scheduler.forget(shipment)
+                    self.scheduler.save()
                 print(f"deleting {shipment.tracking_number} {shipment.name}")
             else:
                 if conf_inp in ["n", "N"]:
                     print("aborting")
                 else:
                     print("unknown input")
-        self.ask_for_further_actions()
 
     def try_adding_new_shipment(self, tracking_number, name):
         self.print_spacing()
@@ -192,13 +325,16 @@ class DhlShipmentConsoleUi:
         print(f"[{res[0]} - {res[1]}]")
 
         if res[2] is not None:
+            if self.scheduler is not None:
+                # just queried - counts like a query with news
+                self.scheduler.record_result(res[2], [res[0], res[1], True])
+                self.scheduler.save()
             print("")
             print(res[2].get_status_string())
         else:
             print("failed to query shipment - aborting")
 
         inp = input("\nPress Enter to continue...")
-        return self.ask_for_further_actions()
 
 
 if __name__ == '__main__':
@@ -1,11 +1,22 @@
 import requests
+import sys
 import time
 import json
-import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dhl_api_transport import DhlApiTransport, LocalResponse
+from response_cache import get_response_hash
+from shipment_collection import ShipmentCollection, normalize_tracking_number
+from service_resolver import ServiceResolver, select_shipment
+from shipment_storage import JsonFileStorage
 
 # feld "events" abfragen
 
 filename = "tracked_shipments.json"
+cached_reason = "OK (cached)"  # reason of results answered from ResponseCache, no api call was made
+already_tracked_reason = "already tracked"  # reason of skipped numbers in add_tracked_shipments
 
 """
 TODO
@@ -17,35 +28,57 @@ TODO
 class ShipmentDescriptor:
     # one shipment can have multiple events
     class EventDescriptor:
-        def __init__(self, event_json):
-            self.raw_json = event_json
-            self.parse_event_json()
+        # many events exist at once - no __dict__, raw json only kept if asked for
+        __slots__ = ["raw_json", "timestamp", "time", "status_code", "status", "status_desc", "key", "nice_string"]
+
+        def __init__(self, event_json, keep_raw_json=False):
+            self.raw_json = event_json if keep_raw_json else None
+            self.nice_string = None  # cache for get_nice_string, events don't change after parsing
+            self.parse_event_json(event_json)
 
-        def parse_event_json(self):
+        def parse_event_json(self, event_json):
             # expected keys = ['timestamp', 'location', 'statusCode', 'status', 'description']
+            #  compact format (see compact_response) has no 'location' and 'description' only if different
 
-            self.timestamp = self.raw_json["timestamp"]
-            self.status_code = self.raw_json["statusCode"]
-            self.status = self.raw_json["status"]
-            self.status_desc = self.raw_json["description"]
+            # same few status codes and texts repeat in all shipments - share one string object each
+            self.timestamp = event_json["timestamp"]
+            self.time = datetime.fromisoformat(self.timestamp)  # eg "2023-04-06T15:38:00"
+            self.status_code = sys.intern(event_json["statusCode"])
+            self.status = sys.intern(event_json["status"])
+            self.status_desc = event_json.get("description", self.status)
 
             # "status" and "description" might be same string
             if self.status == self.status_desc:
                 self.status_desc = ""
+            else:
+                self.status_desc = sys.intern(self.status_desc)
+
+            # identity of an event, see __eq__
+            self.key = (self.timestamp, self.status)
+
+        def to_json(self):
+            # event in compact format
+            event_json = {"timestamp": self.timestamp, "statusCode": self.status_code, "status": self.status}
+            if self.status_desc != "":
+                event_json["description"] = self.status_desc
+            return event_json
 
         def get_nice_string(self):
-            result_string = ""
-            result_string += f"    [{get_time_string_from_timestamp(self.timestamp)}] ({self.status_code})\n"
+            if self.nice_string is not None:
+                return self.nice_string
+
+            parts = [f"    [{get_time_string_from_datetime(self.time)}] ({self.status_code})\n"]
 
             res_lines = split_line_if_too_long(self.status,
                                          76, 72)  # split so that, first line max 76, following max 72 chars
             if res_lines[0] != "":
-                result_string += f"\t{res_lines[0]}"
+                parts.append(f"\t{res_lines[0]}")
 
             for line in res_lines[1:]:
-                result_string += f"\n\t\t{line}"
+                parts.append(f"\n\t\t{line}")
 
-            return result_string
+            self.nice_string = "".join(parts)
+            return self.nice_string
 
         def __str__(self):
             desc = ""
@@ -57,13 +90,20 @@ class ShipmentDescriptor:
             # assume same if status-text and timestamp are equal
             return self.timestamp == other.timestamp and self.status == other.status
 
+        def __hash__(self):
+            return hash(self.key)
+
         def __lt__(self, other):
             # order by timestamp
             return self.timestamp < other.timestamp
 
     def __init__(self, in_json):
-        self.full_json = in_json  # as saved in file
-        self.response_json = None  # as received as response
+        # as saved in file - use get_full_json(), "status_raw" is None after events were parsed
+        self.full_json = in_json
+        # as received as response - string or already parsed json, see property response_json
+        self._response_json = None
+        # response without events - kept instead of response once events are parsed
+        self._response_header = None
 
         self.name = ""
         self.tracking_number = ""
@@ -71,10 +111,19 @@ class ShipmentDescriptor:
         self.last_query = ""
         self.last_update = ""
 
-        self.events: [ShipmentDescriptor.EventDescriptor] = []
+        # parsed from response only when needed, see property events
+        self._events: [ShipmentDescriptor.EventDescriptor] = None
+        self._event_keys = set()  # EventDescriptor.key of all known events
+        self._newest_timestamp = ""  # timestamp of newest known event - older events in replies can be skipped
+        self._status_string = None  # cache for get_status_string, reset when events change
 
         self.was_updated = False
         self.new_events = []
+        self.no_events_compared = 0  # events in last response given to status_has_changed
+        self.response_hash = None  # of last response given to status_has_changed, not saved (see ResponseCache)
+
+        self.is_dirty = False  # changed since last time file was written
+        self.events_changed = False  # new events since storage last wrote all events (journal and sqlite storage)
 
         self.parse_json()
 
@@ -98,16 +147,91 @@ class ShipmentDescriptor:
         self.added = self.full_json["added"]
         self.last_query = self.full_json["last_query"]
         self.last_update = self.full_json["last_update"]
-        self.response_json = self.load_as_json(self.full_json["status_raw"])
-
-        shipment_id, events = self.parse_response_json(self.response_json)
 
-        self.assert_is_correct_tracking_number(shipment_id)
-
-        self.events = events
+        # parsing "status_raw" is expensive (full api-response as string in old files, see compact_response)
+        #  only done when events are actually needed
+        self._response_json = self.full_json["status_raw"]
+
+    def store_response(self, _json):
+        # keep only the parts of the api-response that are used
+        self._response_json = self.full_json["status_raw"] = compact_response(self.get_shipment_json(_json))
+        if self._events is not None:
+            self.release_raw_events()
+
+    def release_raw_events(self):
+        # raw events are not needed any more once EventDescriptors exist, rebuilt from them when saving
+        self._response_header = {key: value for key, value in self.get_shipment_json(self.response_json).items()
+                                 if key != "events"}
+        self._response_json = self.full_json["status_raw"] = None
+
+    def get_full_json(self):
+        # as saved in file
+        if self.full_json["status_raw"] is not None:
+            return self.full_json
+        full_json = dict(self.full_json)
+        full_json["status_raw"] = self.response_json
+        return full_json
+
+    @property
+    def response_json(self):
+        if self._response_json is None:
+            # rebuilt (compact format) - not cached
+            response_json = dict(self._response_header)
+            response_json["events"] = [event.to_json() for event in self._events]
+            return response_json
+        if type(self._response_json) == str:
+            self._response_json = self.load_as_json(self._response_json)
+        return self._response_json
+
+    @property
+    def events(self):
+        if self._events is None:
+            shipment_id, events = self.parse_response_json(self.response_json)
+
+            self.assert_is_correct_tracking_number(shipment_id)
+
+            self.set_events(events)
+            self.release_raw_events()
+        return self._events
+
+    @property
+    def newest_timestamp(self):
+        self.events  # make sure events are parsed
+        return self._newest_timestamp
+
+    def get_newest_status_code(self):
+        # statusCode of newest event, "" if no events - raw events are only scanned if not parsed yet
+        if self._events is not None:
+            return self._events[0].status_code if len(self._events) > 0 else ""
+        events = self.get_shipment_json(self.response_json)["events"]
+        if len(events) == 0:
+            return ""
+        return max(events, key=lambda event: event["timestamp"])["statusCode"]
+
+    def get_destination_country(self):
+        # countryCode of destination, None if unknown
+        header = self._response_header if self._response_json is None else self.get_shipment_json(self.response_json)
+        try:
+            return header["destination"]["address"]["countryCode"]
+        except (KeyError, TypeError):
+            return None
+
+    def get_last_update_seconds(self):
+        try:
+            return get_seconds_from_time_string(self.last_update)
+        except ValueError:
+            return 0.0
+
+    def set_events(self, events):
+        # events must be sorted, newest first
+        self._events = events
+        self._status_string = None
+        self._event_keys = {event.key for event in events}
+        self._newest_timestamp = events[0].timestamp if len(events) > 0 else ""
 
     def assert_is_correct_tracking_number(self, tracking_number):
-        if tracking_number.lower() != self.tracking_number.lower():
+        # same matching as ShipmentCollection.find - case and whitespace don't matter
+        if normalize_tracking_number(tracking_number) != normalize_tracking_number(self.tracking_number):
             print(f"Error: trackingNumbers do not match {tracking_number} {self.tracking_number}")
             exit(1)
 
@@ -116,84 +240,145 @@ class ShipmentDescriptor:
             obj = json.loads(obj)
         return obj
 
-    def parse_response_json(self, _json: str or json):  # TODO just guessing - no error but actually correct??
+    def get_shipment_json(self, _json: str or json):
         _json = self.load_as_json(_json)
 
         # only want part of the api-response - extract if full response was given
         if "shipments" in _json.keys():
-            # only want single shipment
-            if len(_json["shipments"]) != 1:
-                print("ERROR len(response[\"shipments\"]) was not 1 - exiting")
+            # only want single shipment - ServiceResolver resolves ambiguous numbers before,
+            #  if several are given anyway the one with newest event is used
+            if len(_json["shipments"]) == 0:
+                print("ERROR response[\"shipments\"] was empty - exiting")
                 exit(1)
 
-            _json = _json["shipments"][0]
+            _json = select_shipment(_json["shipments"])
 
         # expect keys = ['serviceUrl', 'id', 'service', 'origin', 'status', 'details', 'events']
-        # id: tracking number
-        shipment_id = _json["id"]
-
-        # status: newest event
-        status = _json["status"]
+        #  compact format has no 'status'
         # events: list of all events
         events = _json["events"]
 
-        # expecting status to be included in events
-        if status not in events:
-            events.append(status)
+        # status: newest event, expecting status to be included in events
+        if "status" in _json and _json["status"] not in events:
+            events.append(_json["status"])
+
+        return _json
+
+    def parse_response_json(self, _json: str or json):  # TODO just guessing - no error but actually correct??
+        _json = self.get_shipment_json(_json)
+
+        # id: tracking number
+        shipment_id = _json["id"]
 
         event_descs = []
-        for event in events:
+        for event in _json["events"]:
             event_descs.append(ShipmentDescriptor.EventDescriptor(event))
 
-        event_descs.sort(reverse=True)
+        # api usually sends events newest first - only sort if not
+        for i in range(1, len(event_descs)):
+            if event_descs[i - 1].timestamp < event_descs[i].timestamp:
+                event_descs.sort(reverse=True)
+                break
 
         return [shipment_id, event_descs]
 
-    def status_has_changed(self, _json):
-        shipment_id, reply_events = self.parse_response_json(_json)
+    def status_has_changed(self, _json, queried=True):
+        # queried - response is from a query just made (not from cache), last_query is set to now
+        response_json = self.load_as_json(_json)
+        shipment_json = self.get_shipment_json(response_json)
 
-        self.assert_is_correct_tracking_number(shipment_id)
+        self.assert_is_correct_tracking_number(shipment_json["id"])
 
-        #for event in self.events:
-        #    print(event)
+        # only events not older than newest known event can be new
+        #  compare raw timestamp and status first, EventDescriptors only built if something changed
+        newest_timestamp = self.newest_timestamp
+        new_keys = set()
+        for event in shipment_json["events"]:
+            if event["timestamp"] >= newest_timestamp:
+                key = (event["timestamp"], event["status"])
+                if key not in self._event_keys:
+                    new_keys.add(key)
 
         new_events = []
-        for event in reply_events:
-            #print(event)
-            if event not in self.events:
-                new_events.append(event)
+        if len(new_keys) > 0:
+            shipment_id, reply_events = self.parse_response_json(shipment_json)
+            new_events = [event for event in reply_events if event.key in new_keys]
 
         self.was_updated = len(new_events) > 0
         self.new_events = new_events
+        self.no_events_compared = len(shipment_json["events"])
 
         # update self.full_json for correct saving
-        self.last_query = self.full_json["last_query"] = get_time_string()
+        if queried:
+            self.last_query = self.full_json["last_query"] = get_time_string()
         if self.was_updated:
-            self.events = reply_events
+            self.set_events(reply_events)
             self.last_update = self.full_json["last_update"] = \
-                get_time_string_from_timestamp(reply_events[0].timestamp)
-            self.response_json = self.full_json["status_raw"] = _json
+                get_time_string_from_datetime(reply_events[0].time)
+            self.store_response(shipment_json)
+            self.events_changed = True
 
-        return [len(new_events) > 0, new_events]
+        if queried or self.was_updated:
+            self.is_dirty = True
 
-    def get_status_string(self):
-        result_string = ""
-        for i, event in enumerate(self.events):
-            if i > 0:
-                result_string += "\n"
+        return [len(new_events) > 0, new_events]
 
-            result_string += event.get_nice_string()
+    def set_queried(self):
+        # queried, but response was same as last one - status_has_changed not needed
+        self.was_updated = False
+        self.new_events = []
+        self.last_query = self.full_json["last_query"] = get_time_string()
+        self.is_dirty = True
 
-        return result_string
+    def get_status_string(self):
+        if self._status_string is None:
+            self._status_string = "\n".join([event.get_nice_string() for event in self.events])
+        return self._status_string
 
 
 # handle file, do api calls, stand between shipment-objects and ui
 class DhlShipmentChecker:
-    def __init__(self, api_key, dummy_calls=False):
+    def __init__(self, api_key, dummy_calls=False, max_parallel_requests=8,
+                 flush_every_n=None, flush_interval=None, storage=None, transport=None, quota=None,
+                 metrics=None, response_cache=None, notification_bus=None):
         # self.json_obj = None  # full json-object as saved in file
         self.dummy_calls = dummy_calls
         self.api_key = api_key
-        self.shipments = []  # containing only parts of individual shipments, some convenience functions
+        self.max_parallel_requests = max_parallel_requests
+        # api calls run in parallel, but shipment-objects and file must only be changed by one thread at a time
+        self.lock = threading.RLock()
+
+        # write-behind: changed shipments are only marked dirty, file is written by flush()
+        #  flush() happens at end of each refresh run, or earlier if one of the thresholds is reached
+        #  (None - no threshold)
+        self.flush_every_n = flush_every_n  # number of dirty shipments
+        self.flush_interval = flush_interval  # seconds since last write
+        self.dirty_shipments = set()  # added or updated
+        self.removed_shipments = []
+        self.last_flush_time = time.monotonic()
+
+        # where shipments are saved, default: json file
+        if storage is None:
+            storage = JsonFileStorage(filename)
+        self.storage = storage
+
+        # how api is called - keep pool at least as big as number of parallel requests
+        #  quota (ApiQuotaTracker) counts calls and limits them, None - no limit
+        #  ServiceResolver finds the right service for ambiguous tracking numbers
+        self.quota = quota
+        if transport is None:
+            transport = ServiceResolver(DhlApiTransport(api_key, pool_size=max(10, max_parallel_requests),
+                                                        quota=quota))
+        self.transport = transport
+        # TrackerMetrics - api latency, load/save/diff durations etc, None - nothing is measured
+        self.metrics = metrics
+        # ResponseCache - recent responses are used instead of querying again, None - always query
+        self.response_cache = response_cache
+        # NotificationBus - new events are published to its subscribers, None - nobody is notified
+        self.notification_bus = notification_bus
+        # containing only parts of individual shipments, some convenience functions
+        #  indexed by tracking number, status, destination and last update - see ShipmentCollection.query
+        self.shipments = ShipmentCollection()
         self.status_changed = None
 
         self.saved_json = None
@@ -205,30 +390,185 @@ class DhlShipmentChecker:
     def get_num_tracked_shipments(self):
         return len(self.shipments)
 
+    def find_shipment(self, tracking_number):
+        # None if not tracked
+        return self.shipments.find(tracking_number)
+
     def update_shipment_status_by_index(self, index):
         return self.update_shipment_status(self.json_obj[index])
 
-    def update_shipment_status(self, shipment: ShipmentDescriptor):
+    def update_shipment_status(self, shipment: ShipmentDescriptor, bypass_cache=False):
+        # bypass_cache - query api even if a fresh response is cached
         if self.dummy_calls:
             # pretend as if success but no changes, don't update "last query"
             return [200, "dummy run", False, [shipment.events[0]]]  # newest event
 
         tracking_number = shipment.tracking_number
-        query_result = self.do_shipment_status_api_call(tracking_number)
-        if not query_result.status_code == 200:
-            return [query_result.status_code, query_result.reason, False, [shipment.events[0]]]
+        cached = None
+        if self.response_cache is not None and not bypass_cache:
+            cached = self.response_cache.get(tracking_number)
+
+        if cached is not None:
+            status_code, reason = 200, cached_reason
+            response_text, response_hash = cached["text"], cached["hash"]
+        else:
+            query_result = self.do_shipment_status_api_call(tracking_number)
+            if not query_result.status_code == 200:
+                return [query_result.status_code, query_result.reason, False, [shipment.events[0]]]
+            status_code, reason = query_result.status_code, query_result.reason
+            response_text = query_result.text
+            response_hash = get_response_hash(query_result.content) if self.response_cache is not None else None
 
         # for successful call
         #  give response to shipment-object - ask if it has changed
-        status_has_changed, new_events = shipment.status_has_changed(query_result.text)
-        self.overwrite_json_file()
+        previous_hash = shipment.response_hash
+        if previous_hash is None and response_hash is not None:
+            # not queried in this process yet - hash of last response is in response cache (also if stale)
+            previous_hash = self.response_cache.get_hash(tracking_number)
+        if response_hash is not None and response_hash == previous_hash:
+            # same response as last time - nothing to parse
+            status_has_changed, new_events = False, []
+            shipment.response_hash = response_hash
+            if cached is None:
+                with self.lock:
+                    shipment.set_queried()
+                    self.mark_dirty(shipment)
+        else:
+            status_has_changed, new_events = self.apply_response(shipment, response_text, queried=cached is None)
+            shipment.response_hash = response_hash
+
+        if cached is None and self.response_cache is not None:
+            self.response_cache.put(tracking_number, response_text, response_hash, shipment.get_newest_status_code())
 
         if status_has_changed:
-            return [query_result.status_code, query_result.reason, True, new_events]
+            return [status_code, reason, True, new_events]
         else:
-            return [query_result.status_code, query_result.reason, False, [shipment.events[0]]]  # newest event
-
-    def add_tracked_shipment(self, tracking_number, optional_name=""):
+            return [status_code, reason, False, [shipment.events[0]]]  # newest event
+
+    def apply_response(self, shipment: ShipmentDescriptor, response, queried=True):
+        # response (queried, cached or pushed, string or json) of this shipment - returns [changed, new_events]
+        #  queried=False (cached) - last_query stays as it is
+        with self.lock:
+            if self.metrics is None:
+                status_has_changed, new_events = shipment.status_has_changed(response, queried)
+            else:
+                start = time.perf_counter()
+                status_has_changed, new_events = shipment.status_has_changed(response, queried)
+                self.metrics.record_diff(time.perf_counter() - start, shipment.no_events_compared,
+                                         len(new_events))
+            if status_has_changed and shipment in self.shipments:
+                self.shipments.reindex(shipment)
+            self.mark_dirty(shipment)
+
+        if status_has_changed and self.notification_bus is not None:
+            self.notification_bus.publish(shipment, new_events)
+
+        return [status_has_changed, new_events]
+
+    def update_all_shipment_statuses(self, max_parallel_requests=None, on_result=None, shipments=None,
+                                     bypass_cache=False):
+        # query all shipments (or only given ones), at most max_parallel_requests at the same time
+        # on_result(index, shipment, result) is called (in calling thread) as soon as a result arrives
+        # returns results in same order as self.shipments/shipments
+        if max_parallel_requests is None:
+            max_parallel_requests = self.max_parallel_requests
+        max_parallel_requests = max(1, max_parallel_requests)
+
+        if shipments is None:
+            shipments = self.shipments
+        shipments = list(shipments)
+        results = [None] * len(shipments)
+        if len(shipments) == 0:
+            return results
+
+        # with limited quota most important shipments are queried first
+        order = list(range(len(shipments)))
+        if self.quota is not None:
+            now = time.time()
+            priorities = [self.quota.get_query_priority(shipment, now) for shipment in shipments]
+            order.sort(key=lambda i: priorities[i])
+
+        def update(shipment):
+            # one bad reply (eg missing "events") is a failed result, the other shipments go on
+            try:
+                return self.update_shipment_status(shipment, bypass_cache)
+            except Exception as e:
+                return [None, f"bad response: {type(e).__name__}: {e}", False, [shipment.events[0]]]
+
+        # updates already applied are written even if the run is aborted
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_parallel_requests, len(shipments))) as executor:
+                futures = {executor.submit(update, shipments[i]): i for i in order}
+
+                for future in as_completed(futures):
+                    i = futures[future]
+                    res = future.result()
+
+                    results[i] = res
+                    if on_result is not None:
+                        on_result(i, shipments[i], res)
+        finally:
+            self.flush()
+
+        return results
+
+    def add_tracked_shipment(self, tracking_number, optional_name="", overwrite_file=True):
+        status_code, reason, new_shipment = self.query_new_shipment(tracking_number, optional_name)
+
+        if new_shipment is not None:
+            self.append_new_shipments([new_shipment], overwrite_file)
+
+        return [status_code, reason, new_shipment]
+
+    def add_tracked_shipments(self, new_shipments, max_parallel_requests=None, on_result=None):
+        # bulk import: new_shipments as [[tracking_number, name], ...]
+        # numbers already tracked or duplicated in new_shipments are skipped, others are queried in parallel
+        # all accepted shipments are added in given order and saved with a single write
+        # on_result(index, tracking_number, result) is called as soon as a result is known
+        # returns results in same order as new_shipments, [status_code, reason, shipment or None]
+        if max_parallel_requests is None:
+            max_parallel_requests = self.max_parallel_requests
+        max_parallel_requests = max(1, max_parallel_requests)
+
+        results = [None] * len(new_shipments)
+        new_numbers = set()
+
+        to_query = []
+        for i, (tracking_number, name) in enumerate(new_shipments):
+            number = normalize_tracking_number(tracking_number)
+            if number in new_numbers or self.shipments.find(number) is not None:
+                results[i] = [None, already_tracked_reason, None]
+                if on_result is not None:
+                    on_result(i, tracking_number, results[i])
+            else:
+                new_numbers.add(number)
+                to_query.append(i)
+
+        def query(tracking_number, name):
+            # one bad reply (eg missing "events", no json) fails only this number
+            try:
+                return self.query_new_shipment(tracking_number, name)
+            except Exception as e:
+                return [None, f"bad response: {type(e).__name__}: {e}", None]
+
+        # numbers accepted so far are added even if the import is aborted
+        try:
+            if len(to_query) > 0:
+                with ThreadPoolExecutor(max_workers=min(max_parallel_requests, len(to_query))) as executor:
+                    futures = {executor.submit(query, *new_shipments[i]): i for i in to_query}
+
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        results[i] = future.result()
+                        if on_result is not None:
+                            on_result(i, new_shipments[i][0], results[i])
+        finally:
+            self.append_new_shipments([res[2] for res in results if res is not None and res[2] is not None])
+
+        return results
+
+    def query_new_shipment(self, tracking_number, optional_name=""):
+        # returns [status_code, reason, new ShipmentDescriptor or None] - shipment is not tracked yet
         new_shipment_dict = dict()
         new_shipment_dict["trackingNumber"] = tracking_number
         new_shipment_dict["added"] = get_time_string()
@@ -239,71 +579,150 @@ class DhlShipmentChecker:
         query_result = self.do_shipment_status_api_call(tracking_number)
 
         if not query_result.status_code == 200:
-            print(f"error with request: {query_result.status_code} \"{query_result.reason}\"")
             return [query_result.status_code, query_result.reason, None]
 
         new_shipment_dict["status_raw"] = query_result.text
 
-        self.shipments.append(ShipmentDescriptor(new_shipment_dict))
-        self.overwrite_json_file()
+        new_shipment = ShipmentDescriptor(new_shipment_dict)
+        new_shipment.store_response(query_result.text)
 
-        return [query_result.status_code, query_result.reason, self.shipments[-1]]
+        if self.response_cache is not None:
+            new_shipment.response_hash = get_response_hash(query_result.content)
+            self.response_cache.put(tracking_number, query_result.text, new_shipment.response_hash,
+                                    new_shipment.get_newest_status_code())
 
-    def delete_tracked_shipment(self, shipment: ShipmentDescriptor, overwrite_file=True):
-        self.shipments.remove(shipment)
+        return [query_result.status_code, query_result.reason, new_shipment]
+
+    def append_new_shipments(self, new_shipments, overwrite_file=True):
+        with self.lock:
+            for new_shipment in new_shipments:
+                new_shipment.is_dirty = True
+                self.shipments.append(new_shipment)
+                self.dirty_shipments.add(new_shipment)
+            if overwrite_file:
+                self.flush()
 
-        # CAUTION: file might be overwritten without "temporarily removed" shipment after updates etc
-        if overwrite_file:
-            self.overwrite_json_file()
+    def delete_tracked_shipment(self, shipment: ShipmentDescriptor, overwrite_file=True):
+        with self.lock:
+            self.shipments.remove(shipment)
+            self.dirty_shipments.discard(shipment)
+            self.removed_shipments.append(shipment)
+            if self.response_cache is not None:
+                self.response_cache.remove(shipment.tracking_number)
+
+            # CAUTION: with a single json file another checker (process) can still write its stale copy back
+            #  ShardedJsonStorage only writes changes, removed shipments stay removed
+            if overwrite_file:
+                self.flush()
 
     def do_shipment_status_api_call(self, tracking_number):
-        # ex
-        # curl -X GET 'https://api-eu.dhl.com/track/shipments?trackingNumber=7777777770' -H 'DHL-API-Key:PasteHere_ConsumerKey
-        response = requests.get(f"https://api-eu.dhl.com/track/shipments?trackingNumber={tracking_number}",
-                                headers={
-                                    "DHL-API-Key": self.api_key
-                                }
-                                )
+        if self.metrics is None:
+            return self.get_shipment_status(tracking_number)
+
+        start = time.perf_counter()
+        response = self.get_shipment_status(tracking_number)
+        self.metrics.record_api_call(time.perf_counter() - start, response.status_code, len(response.content))
         return response
 
+    def get_shipment_status(self, tracking_number):
+        try:
+            return self.transport.get_shipment_status(tracking_number)
+        except requests.RequestException as e:
+            # eg timeout or connection error even after retries - report like a failed request
+            return LocalResponse(None, f"request failed: {type(e).__name__}")
+
     def load_json_file(self):
-        if os.path.isfile(filename):
-            with open(filename, 'r') as openfile:
-                self.json_obj = json.load(openfile)
-            self.status_changed = [None] * len(self.json_obj)
-        else:
-            with open(filename, 'w') as fp:
-                fp.write("[]")
-            self.json_obj = []
-            self.status_changed = []
+        start = time.perf_counter()
+        self.json_obj = self.storage.load()
+        self.status_changed = [None] * len(self.json_obj)
+        if self.metrics is not None:
+            self.metrics.record_load(time.perf_counter() - start)
+
+    def mark_dirty(self, shipment: ShipmentDescriptor):
+        with self.lock:
+            if shipment.is_dirty:
+                self.dirty_shipments.add(shipment)
+            self.flush_if_threshold_reached()
+
+    def flush_if_threshold_reached(self):
+        with self.lock:
+            if self.flush_every_n is not None and len(self.dirty_shipments) >= self.flush_every_n:
+                self.flush()
+            elif self.flush_interval is not None and \
+                    time.monotonic() - self.last_flush_time >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        # write file once for all changes since last flush - nothing to do if nothing changed
+        with self.lock:
+            if len(self.removed_shipments) > 0 or len(self.dirty_shipments) > 0:
+                # keep order of self.shipments for changed shipments
+                changed = [shipment for shipment in self.shipments if shipment in self.dirty_shipments]
+                self.save_to_storage(changed)
+
+                for shipment in changed:
+                    shipment.is_dirty = False
+                self.dirty_shipments.clear()
+                self.removed_shipments = []
+
+            if self.response_cache is not None:
+                self.response_cache.save()
+            self.last_flush_time = time.monotonic()
 
     def overwrite_json_file(self):
-        # write to tmp file first, then replace original file
-        # TODO does this make sense?
-
-        full_json = []
-        for shipment in self.shipments:
-            full_json.append(shipment.full_json)
-
-        tmp_filename = f"tmp_{time.time()}.json"
-        with open(tmp_filename, "w") as outfile:
-            json.dump(full_json, outfile, indent=4, sort_keys=True)
+        # save all shipments, no matter if changed or not
+        with self.lock:
+            self.save_to_storage(self.shipments)
+            self.removed_shipments = []
 
-        os.replace(tmp_filename, filename)
+    def save_to_storage(self, changed):
+        start = time.perf_counter()
+        self.storage.save(self.shipments, changed, self.removed_shipments)
+        if self.metrics is not None:
+            self.metrics.record_save(time.perf_counter() - start)
 
 
 # ==============================================================================
 
+def compact_response(shipment_json):
+    # only what ShipmentDescriptor and storage backends use from api-response of a single shipment
+    #  drops 'serviceUrl', 'details', 'status' (repeats newest event), 'possibleAdditionalShipmentsUrl',
+    #  event 'location' and 'description' if same as 'status'
+    compact = {"id": shipment_json["id"]}
+    if "service" in shipment_json:
+        compact["service"] = shipment_json["service"]
+    for key in ["origin", "destination"]:
+        try:
+            compact[key] = {"address": {"countryCode": shipment_json[key]["address"]["countryCode"]}}
+        except (KeyError, TypeError):
+            pass
+
+    events = []
+    for event in shipment_json["events"]:
+        compact_event = {
+            "timestamp": event["timestamp"],
+            "statusCode": event["statusCode"],
+            "status": event["status"],
+        }
+        if event.get("description", event["status"]) != event["status"]:
+            compact_event["description"] = event["description"]
+        events.append(compact_event)
+    compact["events"] = events
+
+    return compact
+
 def get_time_string(time_obj = None):
     if time_obj is None:
         time_obj = time.localtime()
     time_string = time.strftime("%m/%d/%Y, %H:%M:%S", time_obj)
     return time_string
 
-def get_time_string_from_timestamp(inp_str):
-    # eg "2023-04-06T15:38:00"
-    time_obj = time.strptime(inp_str, '%Y-%m-%dT%H:%M:%S')
-    return get_time_string(time_obj)
+def get_time_string_from_datetime(datetime_obj):
+    return datetime_obj.strftime("%m/%d/%Y, %H:%M:%S")
+
+def get_seconds_from_time_string(time_string):
+    # inverse of get_time_string, seconds since epoch
+    return time.mktime(time.strptime(time_string, "%m/%d/%Y, %H:%M:%S"))
 
 def split_line_if_too_long(string, max_line_length, second_max_line_length=None):
     if len(string) <= max_line_length:
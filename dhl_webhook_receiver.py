@@ -0,0 +1,174 @@
+import argparse
+import hmac
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dhl_shipment_status_checker import DhlShipmentChecker, get_time_string
+from polling_scheduler import PollingScheduler
+from shipment_storage import open_storage, default_json_filename
+
+"""
+receives pushed tracking updates instead of polling the api
+
+POST /track/shipments with a body like an api-response: {"shipments": [{"id": ..., "events": [...]}, ...]}
+(a single shipment object without "shipments" is accepted too)
+every shipment is given to status_has_changed of the tracked shipment with the same number and saved,
+unknown numbers are ignored - reply lists the result per shipment
+
+shipments with pushed updates are only polled as fallback (PollingScheduler.push_interval)
+
+    python dhl_webhook_receiver.py --port 8090 --token SECRET [--poll --api-key KEY]
+    python dhl_webhook_sender.py http://127.0.0.1:8090 --token SECRET 00340434161094042557
+
+token (optional) must be sent as header X-Webhook-Token
+"""
+
+max_body_size = 10 * 1024 * 1024
+
+
+class DhlWebhookReceiver:
+    def __init__(self, checker, scheduler=None, host="127.0.0.1", port=0, token=None, on_result=None):
+        self.checker = checker
+        self.scheduler = scheduler  # None - no polling schedule to update
+        self.token = token  # None - no authentication
+        # on_result(shipment, [changed, new_events]) for every pushed shipment that is tracked
+        self.on_result = on_result
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                receiver.handle_post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_post(self, handler):
+        if handler.path.split("?")[0] not in ["/", "/track/shipments"]:
+            return self.send_json(handler, 404, {"error": "not found"})
+
+        if self.token is not None and \
+                not hmac.compare_digest(handler.headers.get("X-Webhook-Token", ""), self.token):
+            return self.send_json(handler, 401, {"error": "bad token"})
+
+        try:
+            length = int(handler.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0 or length > max_body_size:
+            handler.close_connection = True
+            return self.send_json(handler, 413, {"error": "missing or too big Content-Length"})
+
+        # shipments before a bad one are applied and saved anyway
+        try:
+            payload = json.loads(handler.rfile.read(length))
+            shipments_json = payload["shipments"] if "shipments" in payload else [payload]
+            results = [self.apply_shipment_json(shipment_json) for shipment_json in shipments_json]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            results = None
+            error = f"bad payload: {type(e).__name__}"
+        finally:
+            self.checker.flush()
+            if self.scheduler is not None:
+                self.scheduler.save()
+
+        if results is None:
+            return self.send_json(handler, 400, {"error": error})
+        self.send_json(handler, 200, {"results": results})
+
+    def apply_shipment_json(self, shipment_json):
+        tracking_number = shipment_json["id"]
+        shipment = self.checker.find_shipment(tracking_number)
+        if shipment is None:
+            return {"trackingNumber": tracking_number, "result": "not tracked"}
+
+        with self.checker.lock:
+            # pushes may only contain the latest events - keep known ones, status_has_changed expects all
+            pushed_keys = {(event["timestamp"], event["status"]) for event in shipment_json["events"]}
+            shipment_json["events"] = shipment_json["events"] + \
+                [event.to_json() for event in shipment.events if event.key not in pushed_keys]
+            changed, new_events = self.checker.apply_response(shipment, shipment_json, queried=False)
+        if self.scheduler is not None:
+            self.scheduler.record_push(shipment)
+        if self.on_result is not None:
+            self.on_result(shipment, [changed, new_events])
+
+        return {"trackingNumber": shipment.tracking_number, "result": "updated" if changed else "unchanged",
+                "new_events": len(new_events)}
+
+    def send_json(self, handler, status_code, body):
+        data = json.dumps(body).encode()
+        handler.send_response(status_code)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def start(self):
+        # serve in background thread
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def print_result_line(shipment, res, pushed=True):
+    changed, new_events = res
+    print(json.dumps({"time": get_time_string(), "trackingNumber": shipment.tracking_number, "pushed": pushed,
+                      "changed": changed, "new_events": [event.to_json() for event in new_events]}), flush=True)
+
+def print_poll_result_line(index, shipment, res):
+    # res as returned by DhlShipmentChecker.update_shipment_status
+    print_result_line(shipment, [res[2], res[3] if res[2] else []], pushed=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="receive pushed DHL tracking updates, optionally poll as fallback")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--token", default=os.environ.get("DHL_WEBHOOK_TOKEN"),
+                        help="required X-Webhook-Token header (default: environment variable DHL_WEBHOOK_TOKEN)")
+    parser.add_argument("--storage", default=default_json_filename,
+                        help="storage file: *.json (default), *.db for sqlite, *.shards or *.journal directory")
+    parser.add_argument("--poll", action="store_true", help="also poll due shipments (low frequency fallback)")
+    parser.add_argument("--api-key", default=os.environ.get("DHL_API_KEY", ""),
+                        help="only needed with --poll, default: environment variable DHL_API_KEY")
+    args = parser.parse_args()
+
+    if args.poll and args.api_key == "":
+        print("ERROR: --poll needs api-key (--api-key or DHL_API_KEY)", file=sys.stderr)
+        exit(2)
+
+    checker = DhlShipmentChecker(args.api_key, storage=open_storage(args.storage))
+    scheduler = PollingScheduler()
+    receiver = DhlWebhookReceiver(checker, scheduler, args.host, args.port, args.token, print_result_line)
+    print(f"receiving on {receiver.url}", file=sys.stderr)
+
+    try:
+        if args.poll:
+            receiver.start()
+            scheduler.run_daemon(checker, print_poll_result_line)
+        else:
+            receiver.server.serve_forever()
+    except KeyboardInterrupt:
+        receiver.stop()
+        checker.flush()
+        checker.storage.close()
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+from dhl_api_stub import make_shipment_response
+
+"""
+sends tracking updates to dhl_webhook_receiver.py - for testing without any external service
+
+generated updates (like dhl_api_stub.py, newest event now) or payload from a json file
+
+    python dhl_webhook_sender.py http://127.0.0.1:8090 00340434161094042557 JJD000390007868048 --events 4
+    python dhl_webhook_sender.py http://127.0.0.1:8090 --file payload.json
+"""
+
+
+def make_payload(tracking_numbers, no_events=3, delivered=False):
+    # one api-response shaped payload for all tracking numbers, newest event is the current hour
+    start_time = int(time.time()) // 3600 * 3600 - (no_events - 1) * 3600
+    shipments = []
+    for tracking_number in tracking_numbers:
+        shipments.extend(make_shipment_response(tracking_number, no_events, delivered=delivered,
+                                                start_time=start_time)["shipments"])
+    return {"shipments": shipments}
+
+def send_payload(url, payload, token=None, timeout=10):
+    # returns [status code, reply json or text]
+    headers = {}
+    if token is not None:
+        headers["X-Webhook-Token"] = token
+    response = requests.post(url.rstrip("/") + "/track/shipments", json=payload, headers=headers, timeout=timeout)
+    try:
+        return [response.status_code, response.json()]
+    except ValueError:
+        return [response.status_code, response.text]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="send tracking updates to local webhook receiver")
+    parser.add_argument("url", help="eg http://127.0.0.1:8090")
+    parser.add_argument("tracking_numbers", nargs="*")
+    parser.add_argument("--file", default=None, help="send this json payload instead of generated updates")
+    parser.add_argument("--events", type=int, default=3, help="events per generated shipment")
+    parser.add_argument("--delivered", action="store_true", help="newest generated event is delivery")
+    parser.add_argument("--token", default=os.environ.get("DHL_WEBHOOK_TOKEN"))
+    args = parser.parse_intermixed_args()  # options may come before tracking numbers
+
+    if args.file is not None:
+        with open(args.file, "r") as openfile:
+            payload = json.load(openfile)
+    elif len(args.tracking_numbers) > 0:
+        payload = make_payload(args.tracking_numbers, args.events, args.delivered)
+    else:
+        print("ERROR: give tracking numbers or --file", file=sys.stderr)
+        exit(2)
+
+    status_code, reply = send_payload(args.url, payload, args.token)
+    print(status_code, json.dumps(reply))
+    exit(0 if status_code == 200 else 1)
@@ -3,16 +3,67 @@ DHL "Shipment Tracking - Unified" API
 https://developer.dhl.com/api-reference/shipment-tracking#get-started-section/
 '''
 
-import sys
+import argparse
 
+from api_quota import ApiQuotaTracker
+from cassette_transport import RecordingTransport, ReplayTransport
+from dhl_api_transport import DhlApiTransport
 from dhl_shipment_console_ui import DhlShipmentConsoleUi
+from notification_bus import add_notification_arguments, make_notification_bus
+from polling_scheduler import PollingScheduler
+from response_cache import ResponseCache
+from service_resolver import ServiceResolver
+from shipment_storage import open_storage, default_json_filename
+from tracker_metrics import TrackerMetrics
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("ERROR: api-key must be passed as parameter to this script")
-        exit(1)
+    parser = argparse.ArgumentParser(description="track DHL shipments")
+    parser.add_argument("api_key")
+    parser.add_argument("storage", nargs="?", default=default_json_filename,
+                        help="storage file: *.json (default), *.db for sqlite, *.shards or *.journal directory")
+    parser.add_argument("--all", action="store_true",
+                        help="query all shipments, not only the ones due according to schedule")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running, query shipments whenever they are due")
+    parser.add_argument("--parallel", type=int, default=8, help="max number of parallel requests")
+    parser.add_argument("--daily-limit", type=int, default=250, help="max api calls per day")
+    parser.add_argument("--burst", type=int, default=None,
+                        help="max api calls at once, refilled over the day (default: half of daily limit)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="query api even for shipments with a recent response in the response cache")
+    parser.add_argument("--response-cache", default="response_cache.json",
+                        help="file for recent api responses, \"\" - no cache")
+    parser.add_argument("--metrics", default=None,
+                        help="write metrics after each refresh: *.prom (prometheus text) or *.json")
+    parser.add_argument("--record", default=None, help="append api requests and responses to this cassette file")
+    parser.add_argument("--replay", default=None,
+                        help="answer api requests from this cassette file, no network (api_key is ignored), "
+                             "without response cache and schedule state of other runs")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="1 - recorded latency, 10 - ten times faster, 0 - no waiting")
+    add_notification_arguments(parser)
+    args = parser.parse_args()
 
-    api_key = sys.argv[1]
+    quota = ApiQuotaTracker(args.daily_limit, args.burst) if args.replay is None else None
+    transport = None  # default of DhlShipmentChecker
+    response_cache = ResponseCache(args.response_cache) if args.response_cache != "" else None
+    scheduler = PollingScheduler()
+    if args.replay is not None:
+        # every query answered from cassette, state files of real runs are neither used nor changed
+        transport = ServiceResolver(ReplayTransport(args.replay, args.replay_speed), cache_filename=None)
+        response_cache = None
+        scheduler = PollingScheduler(None)
+    elif args.record is not None:
+        transport = ServiceResolver(RecordingTransport(
+            DhlApiTransport(args.api_key, pool_size=max(10, args.parallel), quota=quota), args.record))
 
-    ui = DhlShipmentConsoleUi(api_key)
-    ui.start()
+    ui = DhlShipmentConsoleUi(args.api_key, max_parallel_requests=args.parallel,
+                              storage=open_storage(args.storage), scheduler=scheduler,
+                              quota=quota, transport=transport,
+                              metrics=TrackerMetrics() if args.metrics is not None else None,
+                              metrics_filename=args.metrics, response_cache=response_cache,
+                              notification_bus=make_notification_bus(args))
+    if args.daemon:
+        ui.start_daemon()
+    else:
+        ui.start(args.all, args.refresh)
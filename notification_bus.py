@@ -0,0 +1,190 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+import requests
+
+from dhl_shipment_status_checker import get_time_string
+
+"""
+new events found by DhlShipmentChecker are published to subscribers, independent of any ui
+
+every subscriber has its own bounded queue and worker thread - publish never waits,
+if a subscriber can't keep up its queue fills and further notifications for it are dropped (and counted)
+workers take everything that is waiting (up to batch_size) at once, subscribers with notify_batch get it in one call
+
+    bus = NotificationBus([JsonlSubscriber("events.jsonl"), WebhookSubscriber("http://127.0.0.1:8091/")])
+    checker = DhlShipmentChecker(api_key, notification_bus=bus)
+    ...
+    bus.close()  # waits until queued notifications are delivered
+
+notification: {"trackingNumber", "name", "found", "event": {"timestamp", "statusCode", "status", ...}}
+"""
+
+
+class NotificationBus:
+    def __init__(self, subscribers=(), queue_size=1000, batch_size=100):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.workers = []
+        for subscriber in subscribers:
+            self.subscribe(subscriber)
+
+    def subscribe(self, subscriber):
+        worker = SubscriberWorker(subscriber, self.queue_size, self.batch_size)
+        worker.start()
+        self.workers.append(worker)
+
+    def publish(self, shipment, events):
+        # events: new EventDescriptors of shipment
+        if len(self.workers) == 0:
+            return
+        found = get_time_string()
+        for event in events:
+            notification = get_notification_json(shipment, event, found)
+            for worker in self.workers:
+                worker.put(notification)
+
+    def get_dropped_count(self):
+        return sum(worker.dropped for worker in self.workers)
+
+    def close(self, timeout=30):
+        # deliver what is queued, then stop workers - dropped notifications are reported on stderr
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.dropped > 0:
+                print(f"WARNING: {worker.dropped} notification(s) for {type(worker.subscriber).__name__} dropped, "
+                      f"it could not keep up (queue size {self.queue_size})", file=sys.stderr)
+        self.workers = []
+
+
+class SubscriberWorker(threading.Thread):
+    stop_marker = None
+
+    def __init__(self, subscriber, queue_size, batch_size):
+        super().__init__(daemon=True)
+        self.subscriber = subscriber
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.dropped = 0
+
+    def put(self, notification):
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        # blocks only if queue is full - marker must not be dropped
+        self.queue.put(self.stop_marker)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if self.stop_marker in batch:
+                stopping = True
+                batch = [notification for notification in batch if notification is not self.stop_marker]
+            if len(batch) == 0:
+                continue
+
+            try:
+                if hasattr(self.subscriber, "notify_batch"):
+                    self.subscriber.notify_batch(batch)
+                else:
+                    for notification in batch:
+                        self.subscriber.notify(notification)
+            except Exception as e:
+                # a broken subscriber must not stop the others (or the worker)
+                print(f"ERROR: {type(self.subscriber).__name__} failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+# ==============================================================================
+
+class ConsoleSubscriber:
+    def __init__(self, out=None):
+        self.out = out  # None - sys.stdout
+
+    def notify(self, notification):
+        name = f" ({notification['name']})" if notification["name"] != "" else ""
+        event = notification["event"]
+        print(f"[{notification['found']}] new status \"{notification['trackingNumber']}\"{name}: "
+              f"{event['timestamp']} {event['statusCode']} - {event['status']}", file=self.out or sys.stdout,
+              flush=True)
+
+
+# one json object per line appended to file
+class JsonlSubscriber:
+    def __init__(self, filename):
+        self.filename = filename
+
+    def notify_batch(self, notifications):
+        with open(self.filename, "a", encoding="utf-8") as outfile:
+            outfile.write("".join(json.dumps(notification) + "\n" for notification in notifications))
+
+
+# POST {"notifications": [...]} to url, eg a local service
+class WebhookSubscriber:
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url
+        self.token = token  # sent as X-Webhook-Token
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def notify_batch(self, notifications):
+        headers = {"X-Webhook-Token": self.token} if self.token is not None else {}
+        response = self.session.post(self.url, json={"notifications": notifications}, headers=headers,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+
+
+# runs command (shell) once per batch, notifications as json lines on stdin
+class CommandSubscriber:
+    def __init__(self, command, timeout=60):
+        self.command = command
+        self.timeout = timeout
+
+    def notify_batch(self, notifications):
+        stdin = "".join(json.dumps(notification) + "\n" for notification in notifications)
+        env = dict(os.environ, DHL_NOTIFICATIONS=str(len(notifications)))
+        subprocess.run(self.command, shell=True, input=stdin, text=True, env=env, timeout=self.timeout, check=True)
+
+
+def get_notification_json(shipment, event, found=None):
+    return {
+        "trackingNumber": shipment.tracking_number,
+        "name": shipment.name,
+        "found": found if found is not None else get_time_string(),
+        "event": event.to_json(),
+    }
+
+
+def add_notification_arguments(parser):
+    parser.add_argument("--notify-console", action="store_true", help="print every new event")
+    parser.add_argument("--notify-jsonl", default=None, help="append every new event to this file (json lines)")
+    parser.add_argument("--notify-webhook", default=None, help="POST new events to this url")
+    parser.add_argument("--notify-command", default=None, help="run shell command with new events on stdin")
+
+def make_notification_bus(args, console_out=None):
+    # from arguments of add_notification_arguments, None if no subscriber was given
+    subscribers = []
+    if args.notify_console:
+        subscribers.append(ConsoleSubscriber(console_out))
+    if args.notify_jsonl is not None:
+        subscribers.append(JsonlSubscriber(args.notify_jsonl))
+    if args.notify_webhook is not None:
+        subscribers.append(WebhookSubscriber(args.notify_webhook, os.environ.get("DHL_WEBHOOK_TOKEN")))
+    if args.notify_command is not None:
+        subscribers.append(CommandSubscriber(args.notify_command))
+    return NotificationBus(subscribers) if len(subscribers) > 0 else None
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+
+from dhl_shipment_status_checker import cached_reason, get_seconds_from_time_string
+from shipment_storage import FileLock
+
+"""
+decides when each shipment should be queried next, so api quota is not wasted
+
+interval depends on
+    newest status code   delivered shipments are not queried any more, pre-transit less often than transit
+    last update          shipments without news for days are queried less often
+    change history       shipments that often had news on past queries are queried more often
+
+state (number of queries/changes, next due time) is saved in its own json file (None - only in memory)
+several processes can share the state file - only shipments recorded/forgotten by this process are written
+"""
+
+minute = 60
+hour = 60 * minute
+day = 24 * hour
+
+default_state_filename = "polling_schedule.json"
+
+
+class PollingScheduler:
+    # None - don't query any more
+    base_intervals = {
+        "pre-transit": 6 * hour,
+        "transit": 2 * hour,
+        "failure": 12 * hour,
+        "delivered": None,
+    }
+    default_base_interval = 4 * hour  # unknown status codes
+    min_interval = 15 * minute
+    max_interval = 7 * day
+    retry_interval = 15 * minute  # after failed query
+    push_interval = 1 * day  # fallback query after update was pushed (see dhl_webhook_receiver.py)
+
+    def __init__(self, state_filename=default_state_filename):
+        self.state_filename = state_filename
+        # tracking number (lower case) -> {"next_due", "last_query", "queries", "changes"}
+        self.state = {}
+        # changes since last save - merged into state file as it is when saving
+        self.changed_numbers = set()
+        self.forgotten_numbers = set()
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.state_filename is not None and os.path.isfile(self.state_filename):
+            with open(self.state_filename, "r") as openfile:
+                self.state = json.load(openfile)
+
+    def save(self):
+        if self.state_filename is None:
+            return
+        with self.lock, FileLock(self.state_filename + ".lock"):
+            # read-modify-write - keep what other processes saved in the meantime
+            own_state = self.state
+            self.load()
+            for tracking_number in self.changed_numbers:
+                if tracking_number in own_state:
+                    self.state[tracking_number] = own_state[tracking_number]
+            for tracking_number in self.forgotten_numbers:
+                self.state.pop(tracking_number, None)
+            self.changed_numbers.clear()
+            self.forgotten_numbers.clear()
+
+            tmp_filename = f"{self.state_filename}.{os.getpid()}.tmp"
+            with open(tmp_filename, "w") as outfile:
+                json.dump(self.state, outfile, indent=4, sort_keys=True)
+            os.replace(tmp_filename, self.state_filename)
+
+    def get_shipment_state(self, shipment):
+        return self.state.setdefault(shipment.tracking_number.lower(),
+                                     {"next_due": 0, "last_query": 0, "queries": 0, "changes": 0})
+
+    def get_interval(self, shipment, now=None):
+        # seconds until next query, None - never
+        if now is None:
+            now = time.time()
+
+        status_code = shipment.events[0].status_code if len(shipment.events) > 0 else ""
+        if status_code in self.base_intervals:
+            interval = self.base_intervals[status_code]
+            if interval is None:
+                return None
+        else:
+            interval = self.default_base_interval
+
+        # idle: no new event for days - up to 8 times longer
+        try:
+            idle_days = (now - get_seconds_from_time_string(shipment.last_update)) / day
+        except ValueError:
+            idle_days = 0
+        interval *= min(8.0, max(1.0, idle_days / 2))
+
+        # change rate of past queries, estimate starts at 0.5 for new shipments
+        #  ratio 0.5 keeps interval, lower ratios up to 4 times longer, higher ratios up to 2 times shorter
+        state = self.get_shipment_state(shipment)
+        change_ratio = (state["changes"] + 1) / (state["queries"] + 2)
+        interval *= min(4.0, max(0.5, 0.5 / change_ratio))
+
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def is_due(self, shipment, now=None):
+        if now is None:
+            now = time.time()
+        next_due = self.get_shipment_state(shipment)["next_due"]
+        return next_due is not None and next_due <= now
+
+    def get_due_shipments(self, shipments, now=None):
+        if now is None:
+            now = time.time()
+        return [shipment for shipment in shipments if self.is_due(shipment, now)]
+
+    def get_next_due_time(self, shipments):
+        # earliest time any of the shipments is due, None - none will ever be
+        due_times = [self.get_shipment_state(shipment)["next_due"] for shipment in shipments]
+        due_times = [due_time for due_time in due_times if due_time is not None]
+        return min(due_times) if len(due_times) > 0 else None
+
+    def record_result(self, shipment, res, now=None):
+        # res as returned by DhlShipmentChecker.update_shipment_status
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            state = self.get_shipment_state(shipment)
+            self.changed_numbers.add(shipment.tracking_number.lower())
+            self.forgotten_numbers.discard(shipment.tracking_number.lower())
+            if res[0] != 200:
+                state["next_due"] = now + self.retry_interval
+                return
+
+            # answered from response cache - no query, change ratio stays as it is
+            if res[1] != cached_reason:
+                state["last_query"] = now
+                state["queries"] += 1
+                if res[2]:
+                    state["changes"] += 1
+
+            interval = self.get_interval(shipment, now)
+            state["next_due"] = now + interval if interval is not None else None
+
+    def record_push(self, shipment, now=None):
+        # update arrived without query - only query again as fallback, if pushes stop coming
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            state = self.get_shipment_state(shipment)
+            self.changed_numbers.add(shipment.tracking_number.lower())
+            self.forgotten_numbers.discard(shipment.tracking_number.lower())
+
+            interval = self.get_interval(shipment, now)
+            state["next_due"] = now + max(interval, self.push_interval) if interval is not None else None
+
+    def forget(self, shipment):
+        with self.lock:
+            self.state.pop(shipment.tracking_number.lower(), None)
+            self.changed_numbers.discard(shipment.tracking_number.lower())
+            self.forgotten_numbers.add(shipment.tracking_number.lower())
+
+    def poll(self, checker, on_result=None, query_all=False, bypass_cache=False):
+        # query due shipments (or all), returns [queried shipments, results]
+        if query_all:
+            shipments = list(checker.shipments)
+        else:
+            shipments = self.get_due_shipments(checker.shipments)
+
+        def record_and_report(index, shipment, res):
+            self.record_result(shipment, res)
+            if on_result is not None:
+                on_result(index, shipment, res)
+
+        results = checker.update_all_shipment_statuses(on_result=record_and_report, shipments=shipments,
+                                                       bypass_cache=bypass_cache)
+        self.save()
+
+        return [shipments, results]
+
+    def run_daemon(self, checker, on_result=None, on_idle=None, max_sleep=hour, stop_event=None):
+        # poll due shipments until stop_event is set, sleep until next shipment is due in between
+        if stop_event is None:
+            stop_event = threading.Event()
+
+        while not stop_event.is_set():
+            self.poll(checker, on_result)
+
+            next_due = self.get_next_due_time(checker.shipments)
+            if next_due is None:
+                sleep_time = max_sleep
+            else:
+                sleep_time = min(max_sleep, max(1.0, next_due - time.time()))
+
+            if on_idle is not None:
+                on_idle(sleep_time)
+            stop_event.wait(sleep_time)
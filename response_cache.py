@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from shipment_storage import FileLock
+
+"""
+api responses of the last queries, so queries shortly after each other (add, then start main.py, then batch job)
+don't need the api again
+
+entry per tracking number: time, response text and its hash
+(and per service, if one is given - DhlShipmentChecker queries without, ServiceResolver picks the service)
+entries are fresh for a time depending on the status code of the newest event (ttls) - delivered ones long,
+in transit ones only minutes
+at most max_entries entries, least recently used ones are dropped
+the hash lets DhlShipmentChecker skip status_has_changed when a new response is the same as the last one,
+also in a new process (stale entries still have the hash until they are dropped)
+
+saved to a json file with DhlShipmentChecker.flush (file may be shared by several processes)
+"""
+
+default_cache_filename = "response_cache.json"
+
+minute = 60
+hour = 60 * minute
+day = 24 * hour
+
+default_ttls = {
+    "pre-transit": 30 * minute,
+    "transit": 10 * minute,
+    "failure": 1 * hour,
+    "delivered": 7 * day,
+}
+default_ttl = 10 * minute
+
+
+class ResponseCache:
+    def __init__(self, filename=default_cache_filename, max_entries=1000, ttls=None):
+        self.filename = filename  # None - only in memory
+        self.max_entries = max_entries
+        self.ttls = default_ttls if ttls is None else ttls
+        # "tracking number|service" (lower case) -> {"time", "status_code", "hash", "text"}, least recently used first
+        self.entries = OrderedDict()
+        self.changed_keys = set()  # put since last save
+        self.removed_keys = set()  # removed since last save
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.filename is not None and os.path.isfile(self.filename):
+            with open(self.filename, "r") as openfile:
+                self.entries = OrderedDict(json.load(openfile))
+
+    def save(self):
+        # read-modify-write - entries of other processes are kept, newer entry wins
+        with self.lock:
+            if self.filename is None or len(self.changed_keys) + len(self.removed_keys) == 0:
+                return
+
+            with FileLock(self.filename + ".lock"):
+                own_entries = self.entries
+                self.entries = OrderedDict()
+                self.load()
+                for key in own_entries:
+                    entry = self.entries.get(key)
+                    if key in self.changed_keys and (entry is None or entry["time"] <= own_entries[key]["time"]):
+                        self.entries[key] = own_entries[key]
+                    if key in self.entries:
+                        self.entries.move_to_end(key)
+                for key in self.removed_keys:
+                    self.entries.pop(key, None)
+                self.evict()
+                self.changed_keys.clear()
+                self.removed_keys.clear()
+
+                tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+                with open(tmp_filename, "w") as outfile:
+                    json.dump(list(self.entries.items()), outfile, separators=(",", ":"))
+                os.replace(tmp_filename, self.filename)
+
+    def get_key(self, tracking_number, service=None):
+        return f"{tracking_number}|{service or ''}".lower()
+
+    def get(self, tracking_number, service=None, now=None):
+        # fresh entry or None
+        if now is None:
+            now = time.time()
+        key = self.get_key(tracking_number, service)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or now - entry["time"] >= self.ttls.get(entry["status_code"], default_ttl):
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def get_hash(self, tracking_number, service=None):
+        # hash of last response, also if entry is not fresh any more - None if there is none
+        with self.lock:
+            entry = self.entries.get(self.get_key(tracking_number, service))
+            return entry["hash"] if entry is not None else None
+
+    def put(self, tracking_number, response_text, response_hash, status_code, service=None, now=None):
+        # status_code: of newest event, decides how long entry is fresh
+        key = self.get_key(tracking_number, service)
+        with self.lock:
+            self.entries[key] = {
+                "time": time.time() if now is None else now,
+                "status_code": status_code,
+                "hash": response_hash,
+                "text": response_text,
+            }
+            self.entries.move_to_end(key)
+            self.changed_keys.add(key)
+            self.removed_keys.discard(key)
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_entries:
+            key, entry = self.entries.popitem(last=False)
+            self.changed_keys.discard(key)
+
+    def remove(self, tracking_number, service=None):
+        key = self.get_key(tracking_number, service)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.changed_keys.discard(key)
+            self.removed_keys.add(key)
+
+
+def get_response_hash(content):
+    # content: bytes of response body
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+from dhl_api_transport import LocalResponse
+from shipment_storage import FileLock
+
+"""
+finds the service (parcel-de, express, freight, ...) a tracking number belongs to
+
+api answers a query without service with all shipments it finds (several if number is ambiguous) or 404
+several shipments - the one with the newest event is taken, no further queries
+none - the candidate services (from "possibleAdditionalShipmentsUrl" or candidate_services) are queried at the
+same time and the best answering one is taken
+service of every resolved number is cached in a json file - later queries go straight to that service
+numbers no service knows are only asked again at all services after not_found_retry_time
+
+used like DhlApiTransport (same get_shipment_status), answers always contain a single shipment
+every query of the fan-out counts for the api quota
+"""
+
+default_cache_filename = "service_cache.json"
+not_found_retry_time = 24 * 60 * 60
+
+candidate_services = ["parcel-de", "express", "ecommerce", "ecommerce-europe", "dgf", "freight",
+                      "parcel-nl", "parcel-pl", "parcel-uk", "dsc", "post-de", "post-international", "sameday", "svb"]
+
+
+class ServiceResolver:
+    def __init__(self, transport, cache_filename=default_cache_filename, max_parallel_requests=6):
+        self.transport = transport
+        self.cache_filename = cache_filename  # None - don't save cache
+        self.max_parallel_requests = max_parallel_requests
+        self.services = {}  # tracking number (lower case) -> service
+        self.not_found = {}  # tracking number (lower case) -> time no service knew it
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.cache_filename is not None and os.path.isfile(self.cache_filename):
+            with open(self.cache_filename, "r") as openfile:
+                cache = json.load(openfile)
+            self.services = cache["services"]
+            self.not_found = cache["not_found"]
+
+    def save(self, tracking_number, service=None, not_found_time=None):
+        # remember service (or time it was not found), both None - forget number
+        #  read-modify-write, file may be shared by several processes
+        with self.lock:
+            self.set_entry(tracking_number.lower(), service, not_found_time)
+            if self.cache_filename is None:
+                return
+
+            with FileLock(self.cache_filename + ".lock"):
+                own_services, own_not_found = self.services, self.not_found
+                self.load()
+                for number, own_service in own_services.items():
+                    self.services.setdefault(number, own_service)
+                for number, own_time in own_not_found.items():
+                    self.not_found.setdefault(number, own_time)
+                self.set_entry(tracking_number.lower(), service, not_found_time)
+
+                tmp_filename = f"{self.cache_filename}.{os.getpid()}.tmp"
+                with open(tmp_filename, "w") as outfile:
+                    json.dump({"services": self.services, "not_found": self.not_found}, outfile,
+                              indent=4, sort_keys=True)
+                os.replace(tmp_filename, self.cache_filename)
+
+    def set_entry(self, number, service, not_found_time):
+        self.services.pop(number, None)
+        self.not_found.pop(number, None)
+        if service is not None:
+            self.services[number] = service
+        elif not_found_time is not None:
+            self.not_found[number] = not_found_time
+
+    def get_service(self, tracking_number):
+        with self.lock:
+            return self.services.get(tracking_number.lower())
+
+    def was_recently_not_found(self, tracking_number, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            not_found_time = self.not_found.get(tracking_number.lower())
+        return not_found_time is not None and now - not_found_time < not_found_retry_time
+
+    def get_shipment_status(self, tracking_number, service=None):
+        if service is not None:
+            return self.transport.get_shipment_status(tracking_number, service)
+
+        # known service - one request
+        service = self.get_service(tracking_number)
+        if service is not None:
+            response = self.transport.get_shipment_status(tracking_number, service)
+            if response.status_code != 404:
+                return response
+            self.save(tracking_number, None)  # moved? - resolve again
+
+        response = self.transport.get_shipment_status(tracking_number)
+        if response.status_code not in [200, 404]:
+            return response  # eg quota, server error - no point in asking every service
+        if response.status_code == 404 and self.was_recently_not_found(tracking_number):
+            return response
+
+        shipments_json = []
+        services = list(candidate_services)
+        if response.status_code == 200:
+            response_json = json.loads(response.text)
+            shipments_json = response_json.get("shipments", [])
+            if len(shipments_json) == 1:
+                self.save(tracking_number, shipments_json[0].get("service"))
+                return response
+            if len(shipments_json) > 1:
+                # ambiguous - every shipment comes with its service already, no need to ask the others
+                shipment_json = select_shipment(shipments_json)
+                self.save(tracking_number, shipment_json.get("service"))
+                return LocalResponse(200, f"OK (service {shipment_json.get('service')})",
+                                     json.dumps({"shipments": [shipment_json]}))
+            services = get_additional_services(response_json) or services
+
+        # not found - ask candidate services at the same time
+        error_response = None  # first candidate that answered neither 200 nor 404, eg 503 or quota
+        if len(services) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_requests, len(services))) as executor:
+                responses = list(executor.map(
+                    lambda service: self.transport.get_shipment_status(tracking_number, service), services))
+            for service_response in responses:
+                if service_response.status_code == 200:
+                    shipments_json.extend(json.loads(service_response.text).get("shipments", []))
+                elif service_response.status_code != 404 and error_response is None:
+                    error_response = service_response
+
+        # a failed candidate might have been the right one - only cache what every candidate answered
+        shipment_json = select_shipment(shipments_json)
+        if shipment_json is None:
+            if error_response is not None:
+                return error_response
+            self.save(tracking_number, not_found_time=time.time())
+            return response  # 404 of first query
+
+        if error_response is None:
+            self.save(tracking_number, shipment_json.get("service"))
+        return LocalResponse(200, f"OK (service {shipment_json.get('service')})",
+                             json.dumps({"shipments": [shipment_json]}))
+
+    def close(self):
+        self.transport.close()
+
+
+def get_additional_services(response_json):
+    # services from "possibleAdditionalShipmentsUrl", eg "/track/shipments?trackingNumber=...&service=express"
+    services = []
+    for url in response_json.get("possibleAdditionalShipmentsUrl", []):
+        for service in parse_qs(urlparse(url).query).get("service", []):
+            if service not in services:
+                services.append(service)
+    return services
+
+def select_shipment(shipments_json):
+    # several shipments for one tracking number - take the one with newest event, None if there is none
+    best = None
+    best_timestamp = None
+    for shipment_json in shipments_json:
+        timestamps = [event.get("timestamp", "") for event in shipment_json.get("events", [])]
+        if "status" in shipment_json and isinstance(shipment_json["status"], dict):
+            timestamps.append(shipment_json["status"].get("timestamp", ""))
+        timestamp = max(timestamps, default="")
+        if best is None or timestamp > best_timestamp:
+            best, best_timestamp = shipment_json, timestamp
+    return best
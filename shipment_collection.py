@@ -0,0 +1,151 @@
+import bisect
+import time
+
+"""
+tracked shipments with indexes, used as DhlShipmentChecker.shipments
+
+behaves like the list it replaces (iteration and indexing in tracking order, len, append, remove)
+and additionally finds shipments without scanning all of them
+
+    shipments.find("JJD 0000 1234")                               by tracking number (spaces/case ignored)
+    shipments.query(status_code="transit", not_updated_for=5 * 24 * 60 * 60)
+    shipments.query(status_code=["pre-transit", "transit"], destination_country="DE")
+
+indexed: normalized tracking number, status code of newest event, destination country, last update
+indexes of a shipment must be refreshed with reindex(shipment) when its events changed
+"""
+
+
+def normalize_tracking_number(tracking_number):
+    return "".join(tracking_number.split()).lower()
+
+
+class ShipmentCollection:
+    def __init__(self, shipments=()):
+        self.order = {}  # shipment -> serial number, insertion ordered
+        self.next_serial = 0
+        self.ordered_list = None  # cache for iteration/indexing, None - rebuild
+
+        self.by_number = {}  # normalized tracking number -> [shipments] in insertion order, usually only one
+        self.by_status_code = {}  # status code -> {shipment: None}
+        self.by_destination = {}  # country code -> {shipment: None}
+        self.by_last_update = []  # sorted [(last update seconds, serial, shipment)]
+        self.index_keys = {}  # shipment -> [status code, country code, (last update seconds, serial)]
+
+        for shipment in shipments:
+            self.append(shipment)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        # iterates over a snapshot - collection may be changed meanwhile (eg by worker threads)
+        return iter(self.get_list())
+
+    def __getitem__(self, index):
+        return self.get_list()[index]
+
+    def __contains__(self, shipment):
+        return shipment in self.order
+
+    def get_list(self):
+        if self.ordered_list is None:
+            self.ordered_list = list(self.order)
+        return self.ordered_list
+
+    def append(self, shipment):
+        self.order[shipment] = self.next_serial
+        self.next_serial += 1
+        self.ordered_list = None
+
+        # duplicate tracking numbers are possible - find() returns the first one
+        self.by_number.setdefault(normalize_tracking_number(shipment.tracking_number), []).append(shipment)
+        self.add_to_indexes(shipment)
+
+    def remove(self, shipment):
+        if shipment not in self.order:
+            raise ValueError("shipment not in collection")
+
+        self.remove_from_indexes(shipment)
+        del self.order[shipment]
+        self.ordered_list = None
+
+        number = normalize_tracking_number(shipment.tracking_number)
+        same_number = self.by_number[number]
+        same_number.remove(shipment)
+        if len(same_number) == 0:
+            del self.by_number[number]
+
+    def reindex(self, shipment):
+        # after status/last update of shipment changed
+        self.remove_from_indexes(shipment)
+        self.add_to_indexes(shipment)
+
+    def add_to_indexes(self, shipment):
+        status_code = shipment.get_newest_status_code()
+        country_code = shipment.get_destination_country()
+        update_key = (shipment.get_last_update_seconds(), self.order[shipment])
+
+        self.by_status_code.setdefault(status_code, {})[shipment] = None
+        self.by_destination.setdefault(country_code, {})[shipment] = None
+        bisect.insort(self.by_last_update, update_key + (shipment,))
+        self.index_keys[shipment] = [status_code, country_code, update_key]
+
+    def remove_from_indexes(self, shipment):
+        status_code, country_code, update_key = self.index_keys.pop(shipment)
+
+        for index, key in [[self.by_status_code, status_code], [self.by_destination, country_code]]:
+            del index[key][shipment]
+            if len(index[key]) == 0:
+                del index[key]
+
+        # (seconds, serial) is unique, sorts right before (seconds, serial, shipment)
+        del self.by_last_update[bisect.bisect_left(self.by_last_update, update_key)]
+
+    def find(self, tracking_number):
+        # None if not tracked
+        same_number = self.by_number.get(normalize_tracking_number(tracking_number))
+        return same_number[0] if same_number is not None else None
+
+    def count_by_status_code(self):
+        return {status_code: len(shipments) for status_code, shipments in self.by_status_code.items()}
+
+    def query(self, status_code=None, destination_country=None, updated_after=None, updated_before=None,
+              not_updated_for=None, now=None):
+        # all shipments matching every given filter, in tracking order
+        #  status_code/destination_country: single value or list of values
+        #  updated_after/updated_before: seconds since epoch, not_updated_for: seconds before now
+        if not_updated_for is not None:
+            if now is None:
+                now = time.time()
+            limit = now - not_updated_for
+            updated_before = limit if updated_before is None else min(updated_before, limit)
+
+        # candidates from every given filter, smallest one is checked against the others
+        candidate_sets = []
+        if status_code is not None:
+            candidate_sets.append(self.get_index_matches(self.by_status_code, status_code))
+        if destination_country is not None:
+            candidate_sets.append(self.get_index_matches(self.by_destination, destination_country))
+        if updated_after is not None or updated_before is not None:
+            start = 0 if updated_after is None else bisect.bisect_right(self.by_last_update, (updated_after, float("inf")))
+            end = len(self.by_last_update) if updated_before is None else \
+                bisect.bisect_left(self.by_last_update, (updated_before, -1))
+            candidate_sets.append({entry[2]: None for entry in self.by_last_update[start:end]})
+
+        if len(candidate_sets) == 0:
+            return list(self.get_list())
+
+        candidate_sets.sort(key=len)
+        result = [shipment for shipment in candidate_sets[0]
+                  if all(shipment in candidates for candidates in candidate_sets[1:])]
+        result.sort(key=lambda shipment: self.order[shipment])
+        return result
+
+    def get_index_matches(self, index, values):
+        if type(values) != list:
+            return index.get(values, {})
+        matches = {}
+        for value in values:
+            matches.update(index.get(value, {}))
+        return matches
@@ -0,0 +1,743 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# advisory file locks - fcntl on unix, msvcrt on windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+"""
+storage backends for tracked shipments
+
+every backend knows
+    load()                               -> list of shipment dicts as saved in json file
+                                            keys ['added', 'last_query', 'last_update', 'name', 'status_raw', 'trackingNumber']
+    save(shipments, changed, removed)    -> persist changes
+                                            shipments: all currently tracked shipments (ShipmentDescriptor)
+                                            changed: added or updated shipments, removed: deleted shipments
+    close()
+"""
+
+default_json_filename = "tracked_shipments.json"
+default_sqlite_filename = "tracked_shipments.db"
+default_shards_directory = "tracked_shipments.shards"
+default_no_shards = 16
+default_journal_directory = "tracked_shipments.journal"
+
+"""
+json file versions
+    1: list of shipments, "status_raw" is full api-response as string
+    2: {"version": 2, "shipments": [...]}, "status_raw" is object with only used fields (see compact_response)
+"""
+json_file_version = 2
+
+
+# all shipments in a single json file - file is rewritten completely on every save
+#  *.json.gz (gzip) and *.json.zst (zstandard, if installed) are compressed
+class JsonFileStorage:
+    def __init__(self, filename=default_json_filename, indent=None):
+        self.filename = filename
+        self.indent = indent  # None - no pretty printing, smaller file
+
+    def open_file(self, filename, mode):
+        # text mode file object, compressed depending on file extension
+        if self.filename.endswith(".gz"):
+            return gzip.open(filename, mode + "t", encoding="utf-8")
+        if self.filename.endswith(".zst"):
+            if zstandard is None:
+                print("ERROR: *.zst needs module zstandard (pip install zstandard)")
+                exit(1)
+            return zstandard.open(filename, mode + "t", encoding="utf-8")
+        return open(filename, mode, encoding="utf-8")
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            self.write_json_atomic([])
+            return []
+
+        with self.open_file(self.filename, 'r') as openfile:
+            file_json = json.load(openfile)
+
+        if type(file_json) == list:
+            # version 1 - convert once, keep copy of old file
+            if len(file_json) > 0:
+                shutil.copyfile(self.filename, self.filename + ".v1.bak")
+            shipments_json = migrate_v1_to_v2(file_json)
+            self.write_json_atomic(shipments_json)
+            return shipments_json
+
+        if file_json["version"] != json_file_version:
+            print(f"ERROR: unknown file version {file_json['version']} in \"{self.filename}\"")
+            exit(1)
+
+        return file_json["shipments"]
+
+    def save(self, shipments, changed=None, removed=None):
+        full_json = []
+        for shipment in shipments:
+            full_json.append(shipment.get_full_json())
+
+        self.write_json_atomic(full_json)
+
+    def write_json_atomic(self, shipments_json):
+        # write to tmp file first, then replace original file
+        #  os.replace is atomic - file is either old or new version, never half written
+        file_json = {"version": json_file_version, "shipments": shipments_json}
+
+        # pid in name - several processes may write files in the same directory
+        tmp_filename = os.path.join(os.path.dirname(os.path.abspath(self.filename)),
+                                    f"tmp_{os.getpid()}_{time.time()}.json")
+        with self.open_file(tmp_filename, "w") as outfile:
+            if self.indent is None:
+                json.dump(file_json, outfile, separators=(",", ":"), sort_keys=True)
+            else:
+                json.dump(file_json, outfile, indent=self.indent, sort_keys=True)
+            outfile.flush()
+        # compressed file objects can't be fsynced directly
+        with open(tmp_filename, "rb+") as outfile:
+            os.fsync(outfile.fileno())
+
+        os.replace(tmp_filename, self.filename)
+
+    def close(self):
+        pass
+
+
+# shipments split into shard files by hash of tracking number, several processes can use the same directory
+#  every save locks the affected shards, reads them, applies only the changes and writes them back
+#  -> changes of other processes to other shipments are kept (same shipment: last writer wins)
+#  shards: load only these shard numbers (eg one worker process per group of shards), None - all
+class ShardedJsonStorage:
+    def __init__(self, directory=default_shards_directory, no_shards=default_no_shards, shards=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # number of shards is fixed when directory is created - otherwise shipments would end up in wrong shards
+        meta_filename = os.path.join(directory, "shards.json")
+        with FileLock(os.path.join(directory, "shards.lock")):
+            if os.path.isfile(meta_filename):
+                with open(meta_filename, "r") as openfile:
+                    no_shards = json.load(openfile)["shards"]
+            else:
+                with open(meta_filename, "w") as outfile:
+                    json.dump({"shards": no_shards}, outfile)
+        self.no_shards = no_shards
+
+        self.shards = list(range(no_shards)) if shards is None else shards
+        for shard in self.shards:
+            if shard < 0 or shard >= no_shards:
+                print(f"ERROR: shard {shard} does not exist in \"{directory}\" ({no_shards} shards)")
+                exit(1)
+
+        self.loaded_numbers = set()  # tracking numbers (lower case) that were in a shard file when loaded/saved
+
+    def get_shard(self, tracking_number):
+        # crc32 instead of hash() - must be the same in every process
+        return zlib.crc32(tracking_number.lower().encode()) % self.no_shards
+
+    def get_shard_storage(self, shard):
+        return JsonFileStorage(os.path.join(self.directory, f"shard_{shard:03d}.json"))
+
+    def get_lock_filename(self, shard):
+        # separate lock file - shard file itself is replaced on every write
+        return os.path.join(self.directory, f"shard_{shard:03d}.lock")
+
+    def load(self):
+        result = []
+        for shard in self.shards:
+            with FileLock(self.get_lock_filename(shard)):
+                shipments_json = self.get_shard_storage(shard).load()
+            for shipment_json in shipments_json:
+                self.loaded_numbers.add(shipment_json["trackingNumber"].lower())
+            result.extend(shipments_json)
+        return result
+
+    def save(self, shipments, changed=None, removed=None):
+        if changed is None:
+            changed = shipments
+
+        # group changes by shard, each affected shard is locked and rewritten once
+        changes_by_shard = {}
+        for shipment in changed:
+            changes_by_shard.setdefault(self.get_shard(shipment.tracking_number), [[], []])[0].append(shipment)
+        for shipment in removed or []:
+            changes_by_shard.setdefault(self.get_shard(shipment.tracking_number), [[], []])[1].append(shipment)
+
+        for shard, (shard_changed, shard_removed) in sorted(changes_by_shard.items()):
+            with FileLock(self.get_lock_filename(shard)):
+                self.save_shard(shard, shard_changed, shard_removed)
+
+    def save_shard(self, shard, changed, removed):
+        # read-modify-write, must only be called with shard locked
+        shard_storage = self.get_shard_storage(shard)
+        shipments_json = shard_storage.load()
+        index_by_number = {shipment_json["trackingNumber"].lower(): i for i, shipment_json in enumerate(shipments_json)}
+
+        removed_numbers = {shipment.tracking_number.lower() for shipment in removed}
+        for shipment in changed:
+            number = shipment.tracking_number.lower()
+            if number in index_by_number:
+                shipments_json[index_by_number[number]] = shipment.get_full_json()
+            elif number in self.loaded_numbers:
+                # removed by other process since it was loaded here - don't bring it back
+                continue
+            else:
+                index_by_number[number] = len(shipments_json)
+                shipments_json.append(shipment.get_full_json())
+            self.loaded_numbers.add(number)
+
+        shipments_json = [shipment_json for shipment_json in shipments_json
+                          if shipment_json["trackingNumber"].lower() not in removed_numbers]
+        self.loaded_numbers -= removed_numbers
+
+        shard_storage.write_json_atomic(shipments_json)
+
+    def close(self):
+        pass
+
+
+# last snapshot (json file) plus append-only journal of changes since - a save only appends its changes
+#  one record per line, all records of a save are written and fsynced at once
+#      {"op": "put", "shipment": {...}}    added shipment or one with new events, as in json file
+#      {"op": "touch", "trackingNumber", "name", "last_query", "last_update"}    only queried
+#      {"op": "remove", "trackingNumber"}
+#  load replays the journal over the snapshot
+#  once the journal is big compared to the snapshot, it is renamed and folded into a new snapshot by a
+#  background thread, new saves go to a new journal meanwhile
+#  records set absolute values - replaying one twice (crash during compaction) gives the same result
+class JournaledJsonStorage:
+    def __init__(self, directory=default_journal_directory, compact_ratio=0.5, min_compact_size=1024 * 1024):
+        self.directory = directory
+        # compact when journal is bigger than compact_ratio * snapshot size, but at least min_compact_size bytes
+        self.compact_ratio = compact_ratio
+        self.min_compact_size = min_compact_size
+        os.makedirs(directory, exist_ok=True)
+
+        self.snapshot = JsonFileStorage(os.path.join(directory, "snapshot.json"))
+        self.journal_filename = os.path.join(directory, "journal.jsonl")
+        self.compacting_filename = os.path.join(directory, "journal.compacting.jsonl")
+        # journal.lock for appending and reading, compaction.lock - only one compaction at a time
+        self.lock_filename = os.path.join(directory, "journal.lock")
+        self.compaction_lock_filename = os.path.join(directory, "compaction.lock")
+
+        with FileLock(self.lock_filename):
+            if not os.path.isfile(self.snapshot.filename):
+                self.snapshot.write_json_atomic([])
+
+        self.saved_numbers = set()  # tracking numbers (lower case) in snapshot + journal, others need "put"
+        self.compaction_thread = None
+
+    def load(self):
+        with FileLock(self.lock_filename):
+            shipments_by_number = self.read_state([self.compacting_filename, self.journal_filename])
+        self.saved_numbers = set(shipments_by_number.keys())
+        return list(shipments_by_number.values())
+
+    def read_state(self, journal_filenames):
+        # snapshot with journals replayed: tracking number (lower case) -> shipment dict, in order of adding
+        shipments_by_number = {}
+        for shipment_json in self.snapshot.load():
+            shipments_by_number[shipment_json["trackingNumber"].lower()] = shipment_json
+
+        for journal_filename in journal_filenames:
+            if not os.path.isfile(journal_filename):
+                continue
+            with open(journal_filename, "r", encoding="utf-8") as openfile:
+                for line in openfile:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # cut off by crash while writing - that save never finished
+                        continue
+                    apply_journal_record(shipments_by_number, record)
+
+        return shipments_by_number
+
+    def save(self, shipments, changed=None, removed=None):
+        if changed is None:
+            changed = shipments
+
+        records = []
+        for shipment in removed or []:
+            records.append({"op": "remove", "trackingNumber": shipment.tracking_number})
+            self.saved_numbers.discard(shipment.tracking_number.lower())
+
+        for shipment in changed:
+            number = shipment.tracking_number.lower()
+            if number not in self.saved_numbers or shipment.events_changed:
+                records.append({"op": "put", "shipment": shipment.get_full_json()})
+                self.saved_numbers.add(number)
+                shipment.events_changed = False
+            else:
+                records.append({"op": "touch", "trackingNumber": shipment.tracking_number, "name": shipment.name,
+                                "last_query": shipment.last_query, "last_update": shipment.last_update})
+
+        if len(records) == 0:
+            return
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode("utf-8")
+
+        with FileLock(self.lock_filename):
+            with open(self.journal_filename, "a+b") as outfile:
+                # last save was cut off by a crash - start a new line, the broken one is skipped when loading
+                journal_size = outfile.seek(0, os.SEEK_END)
+                if journal_size > 0:
+                    outfile.seek(journal_size - 1)
+                    if outfile.read(1) != b"\n":
+                        data = b"\n" + data
+
+                outfile.write(data)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+                journal_size = outfile.tell()
+
+        if journal_size >= max(self.min_compact_size, os.path.getsize(self.snapshot.filename) * self.compact_ratio):
+            self.start_compaction()
+
+    def start_compaction(self):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        self.compaction_thread = threading.Thread(target=self.compact, daemon=True)
+        self.compaction_thread.start()
+
+    def compact(self):
+        # fold journal into new snapshot - other processes may save (or load) meanwhile
+        with FileLock(self.compaction_lock_filename):
+            with FileLock(self.lock_filename):
+                # journal.compacting.jsonl still there - last compaction crashed, fold that one first
+                if not os.path.isfile(self.compacting_filename):
+                    if not os.path.isfile(self.journal_filename):
+                        return
+                    os.replace(self.journal_filename, self.compacting_filename)
+
+            shipments_by_number = self.read_state([self.compacting_filename])
+            self.snapshot.write_json_atomic(list(shipments_by_number.values()))
+
+            # load reads snapshot and journals with lock held - sees either this journal or the new snapshot
+            with FileLock(self.lock_filename):
+                os.remove(self.compacting_filename)
+
+    def close(self):
+        # running compaction is finished, else journal is folded next time
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+
+
+# blocking advisory lock on a lock file, as context manager
+#  exclusive only - windows (msvcrt) has no shared locks
+class FileLock:
+    def __init__(self, filename):
+        self.filename = filename
+        self.lockfile = None
+
+    def __enter__(self):
+        self.lockfile = open(self.filename, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_EX)
+        else:
+            # locks first byte, LK_LOCK gives up after 10 tries (1 per second) - keep trying
+            self.lockfile.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
+        else:
+            self.lockfile.seek(0)
+            msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_UNLCK, 1)
+        self.lockfile.close()
+        self.lockfile = None
+
+
+# normalized tables for shipments and events - only changed rows are written
+class SqliteStorage:
+    schema = """
+        CREATE TABLE IF NOT EXISTS shipments (
+            tracking_number TEXT PRIMARY KEY COLLATE NOCASE,
+            name TEXT NOT NULL DEFAULT '',
+            added TEXT,
+            last_query TEXT,
+            last_update TEXT,
+            shipment_id TEXT,
+            service TEXT,
+            origin_country TEXT,
+            destination_country TEXT,
+            status_code TEXT,
+            status_timestamp TEXT
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            tracking_number TEXT NOT NULL COLLATE NOCASE
+                REFERENCES shipments(tracking_number) ON DELETE CASCADE,
+            timestamp TEXT NOT NULL,
+            status_code TEXT,
+            status TEXT NOT NULL,
+            description TEXT,
+            PRIMARY KEY (tracking_number, timestamp, status)
+        );
+        -- primary keys already index tracking_number
+        CREATE INDEX IF NOT EXISTS idx_shipments_status_code ON shipments(status_code);
+        CREATE INDEX IF NOT EXISTS idx_shipments_status_timestamp ON shipments(status_timestamp);
+        CREATE INDEX IF NOT EXISTS idx_events_status_code ON events(status_code);
+        CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+    """
+
+    def __init__(self, filename=default_sqlite_filename):
+        self.filename = filename
+        # calls are serialized by DhlShipmentChecker.lock, but may come from worker threads
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.schema)
+        self.connection.commit()
+
+        self.saved_numbers = set()  # tracking numbers (lower case) that have a row in table "shipments"
+
+    def load(self):
+        events_by_number = {}
+        cursor = self.connection.execute(
+            "SELECT tracking_number, timestamp, status_code, status, description "
+            "FROM events ORDER BY tracking_number, timestamp DESC")
+        for tracking_number, timestamp, status_code, status, description in cursor:
+            event = {
+                "timestamp": timestamp,
+                "statusCode": status_code,
+                "status": status,
+                "description": description if description is not None else status,
+            }
+            events_by_number.setdefault(tracking_number.lower(), []).append(event)
+
+        result = []
+        cursor = self.connection.execute(
+            "SELECT tracking_number, name, added, last_query, last_update, "
+            "shipment_id, service, origin_country, destination_country FROM shipments ORDER BY rowid")
+        for row in cursor:
+            tracking_number, name, added, last_query, last_update, \
+                shipment_id, service, origin_country, destination_country = row
+            events = events_by_number.get(tracking_number.lower(), [])
+
+            # rebuild api-response in compact format (see compact_response), like json files have it
+            shipment_json = {"id": shipment_id}
+            if service is not None:
+                shipment_json["service"] = service
+            if origin_country is not None:
+                shipment_json["origin"] = {"address": {"countryCode": origin_country}}
+            if destination_country is not None:
+                shipment_json["destination"] = {"address": {"countryCode": destination_country}}
+            shipment_json["events"] = events
+
+            result.append({
+                "trackingNumber": tracking_number,
+                "name": name,
+                "added": added,
+                "last_query": last_query,
+                "last_update": last_update,
+                "status_raw": shipment_json,
+            })
+            self.saved_numbers.add(tracking_number.lower())
+
+        return result
+
+    def save(self, shipments, changed=None, removed=None):
+        if changed is None:
+            changed = shipments
+
+        with self.connection:  # one transaction for all changes
+            for shipment in removed or []:
+                self.connection.execute("DELETE FROM shipments WHERE tracking_number = ?",
+                                        (shipment.tracking_number,))
+                self.saved_numbers.discard(shipment.tracking_number.lower())
+
+            for shipment in changed:
+                self.upsert_shipment(shipment)
+
+    def upsert_shipment(self, shipment):
+        response = get_shipment_json(shipment.response_json)
+        newest_event = shipment.events[0] if len(shipment.events) > 0 else None
+
+        self.connection.execute(
+            """INSERT INTO shipments (tracking_number, name, added, last_query, last_update, shipment_id, service,
+                                      origin_country, destination_country, status_code, status_timestamp)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(tracking_number) DO UPDATE SET
+                   name = excluded.name,
+                   last_query = excluded.last_query,
+                   last_update = excluded.last_update,
+                   shipment_id = excluded.shipment_id,
+                   service = excluded.service,
+                   origin_country = excluded.origin_country,
+                   destination_country = excluded.destination_country,
+                   status_code = excluded.status_code,
+                   status_timestamp = excluded.status_timestamp""",
+            (shipment.tracking_number, shipment.name, shipment.added, shipment.last_query, shipment.last_update,
+             response.get("id"), response.get("service"),
+             get_country_code(response, "origin"), get_country_code(response, "destination"),
+             newest_event.status_code if newest_event is not None else None,
+             newest_event.timestamp if newest_event is not None else None))
+
+        # known shipment - event rows only change if events changed since last save, then all are replaced
+        #  (new_events only holds the last diff, api may also drop or replace events)
+        if shipment.tracking_number.lower() in self.saved_numbers:
+            if not shipment.events_changed:
+                return
+            self.connection.execute("DELETE FROM events WHERE tracking_number = ?", (shipment.tracking_number,))
+        self.saved_numbers.add(shipment.tracking_number.lower())
+        shipment.events_changed = False
+        events = shipment.events
+
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO events (tracking_number, timestamp, status_code, status, description) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(shipment.tracking_number, event.timestamp, event.status_code, event.status,
+              event.status_desc if event.status_desc != "" else None)
+             for event in events])
+
+    def close(self):
+        self.connection.close()
+
+
+# ==============================================================================
+
+def open_storage(filename, shards=None):
+    # choose backend by file extension, *.shards (ShardedJsonStorage) and *.journal (JournaledJsonStorage)
+    #  are directories
+    extension = os.path.splitext(filename.rstrip("/\\"))[1].lower()
+    if extension in [".db", ".sqlite", ".sqlite3"]:
+        return SqliteStorage(filename)
+    if extension == ".shards" or (os.path.isdir(filename) and extension != ".journal"):
+        return ShardedJsonStorage(filename, shards=shards)
+    if shards is not None:
+        print("ERROR: shards can only be selected for sharded storage (*.shards)")
+        exit(1)
+    if extension == ".journal":
+        return JournaledJsonStorage(filename)
+    return JsonFileStorage(filename)
+
+def get_shipment_json(response):
+    # part of api-response for single shipment
+    if type(response) == str:
+        response = json.loads(response)
+    if "shipments" in response.keys():
+        response = response["shipments"][0]
+    return response
+
+def get_country_code(shipment_json, key):
+    try:
+        return shipment_json[key]["address"]["countryCode"]
+    except (KeyError, TypeError):
+        return None
+
+def apply_journal_record(shipments_by_number, record):
+    # see JournaledJsonStorage
+    if record["op"] == "put":
+        shipments_by_number[record["shipment"]["trackingNumber"].lower()] = record["shipment"]
+        return
+
+    number = record["trackingNumber"].lower()
+    if record["op"] == "remove":
+        shipments_by_number.pop(number, None)
+    elif record["op"] == "touch" and number in shipments_by_number:
+        shipment_json = dict(shipments_by_number[number])
+        for key in ["name", "last_query", "last_update"]:
+            shipment_json[key] = record[key]
+        shipments_by_number[number] = shipment_json
+
+def migrate_v1_to_v2(shipments_json):
+    from dhl_shipment_status_checker import ShipmentDescriptor
+
+    for shipment_json in shipments_json:
+        shipment = ShipmentDescriptor(shipment_json)
+        shipment.store_response(shipment.response_json)  # replaces "status_raw" in shipment_json
+    return shipments_json
+
+def migrate_json_to_sqlite(json_filename=default_json_filename, sqlite_filename=default_sqlite_filename):
+    # one-shot copy of all shipments from json file into (new or existing) sqlite database
+    from dhl_shipment_status_checker import ShipmentDescriptor
+
+    shipments = [ShipmentDescriptor(shipment_json) for shipment_json in JsonFileStorage(json_filename).load()]
+
+    storage = SqliteStorage(sqlite_filename)
+    storage.load()
+    storage.save(shipments)
+    storage.close()
+
+    check_loaded_shipments(SqliteStorage(sqlite_filename), shipments)
+
+    return len(shipments)
+
+def check_loaded_shipments(storage, shipments):
+    # shipments from storage must load in DhlShipmentChecker like the ones saved
+    from dhl_shipment_status_checker import DhlShipmentChecker
+
+    checker = DhlShipmentChecker("", dummy_calls=True, storage=storage)
+    for shipment in shipments:
+        loaded = checker.find_shipment(shipment.tracking_number)
+        if loaded is None or loaded.events != shipment.events or \
+                loaded.get_destination_country() != shipment.get_destination_country():
+            print(f"ERROR: \"{shipment.tracking_number}\" was not loaded correctly from {type(storage).__name__}")
+            exit(1)
+    storage.close()
+
+
+def migrate_json_to_shards(json_filename=default_json_filename, directory=default_shards_directory,
+                           no_shards=default_no_shards):
+    # one-shot copy of all shipments from json file into (new or existing) sharded directory
+    from dhl_shipment_status_checker import ShipmentDescriptor
+
+    shipments = [ShipmentDescriptor(shipment_json) for shipment_json in JsonFileStorage(json_filename).load()]
+
+    storage = ShardedJsonStorage(directory, no_shards)
+    storage.load()
+    storage.save(shipments)
+
+    return [len(shipments), storage.no_shards]
+
+
+def migrate_json_to_journal(json_filename=default_json_filename, directory=default_journal_directory):
+    # one-shot copy of all shipments from json file into (new or existing) journal directory, folded into snapshot
+    from dhl_shipment_status_checker import ShipmentDescriptor
+
+    shipments = [ShipmentDescriptor(shipment_json) for shipment_json in JsonFileStorage(json_filename).load()]
+
+    storage = JournaledJsonStorage(directory)
+    storage.load()
+    storage.save(shipments)
+    storage.close()
+    storage.compact()
+
+    return len(shipments)
+
+
+def measure_json_formats(filename=default_json_filename, repeat=5):
+    # size and load time of the same shipments as version 1, version 2 and compressed version 2
+    #  filename is not changed, files are written to a temp directory next to it
+    import copy
+    import tempfile
+    from dhl_shipment_status_checker import ShipmentDescriptor
+
+    storage = JsonFileStorage(filename)
+    with storage.open_file(filename, "r") as openfile:
+        file_json = json.load(openfile)
+
+    if type(file_json) == list:
+        v1_json = file_json
+        v2_json = migrate_v1_to_v2(copy.deepcopy(file_json))
+    else:
+        # version 1 rebuilt from compact data - real version 1 files are bigger (urls, locations, ...)
+        v2_json = file_json["shipments"]
+        v1_json = []
+        for shipment_json in v2_json:
+            v1_shipment = dict(shipment_json)
+            v1_shipment["status_raw"] = json.dumps({"shipments": [shipment_json["status_raw"]]})
+            v1_json.append(v1_shipment)
+    shipments = [ShipmentDescriptor(shipment_json) for shipment_json in v2_json]
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as tmp_dir:
+        v1_filename = os.path.join(tmp_dir, "v1.json")
+        with open(v1_filename, "w") as outfile:
+            json.dump(v1_json, outfile, indent=4, sort_keys=True)
+
+        # load: read file and parse all events, like a full refresh run needs it
+        def load_v1():
+            with open(v1_filename, "r") as openfile:
+                for shipment_json in json.load(openfile):
+                    ShipmentDescriptor(shipment_json).events
+
+        results.append(["version 1", os.path.getsize(v1_filename), measure_time(load_v1, repeat)])
+
+        for extension in [".json", ".json.gz"] + ([".json.zst"] if zstandard is not None else []):
+            v2_storage = JsonFileStorage(os.path.join(tmp_dir, "v2" + extension))
+            v2_storage.save(shipments)
+
+            def load_v2():
+                for shipment_json in v2_storage.load():
+                    ShipmentDescriptor(shipment_json).events
+
+            results.append([f"version 2 ({extension})", os.path.getsize(v2_storage.filename),
+                            measure_time(load_v2, repeat)])
+
+    return results
+
+def measure_time(function, repeat):
+    # best of repeat runs, seconds
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="convert or compare shipment storage files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_sqlite = subparsers.add_parser("to-sqlite", help="copy shipments from json file into sqlite database")
+    parser_sqlite.add_argument("json_file", nargs="?", default=default_json_filename)
+    parser_sqlite.add_argument("sqlite_file", nargs="?", default=default_sqlite_filename)
+
+    parser_shards = subparsers.add_parser("to-shards", help="copy shipments from json file into sharded directory")
+    parser_shards.add_argument("json_file", nargs="?", default=default_json_filename)
+    parser_shards.add_argument("directory", nargs="?", default=default_shards_directory)
+    parser_shards.add_argument("--shards", type=int, default=default_no_shards,
+                               help="number of shard files (only for new directory)")
+
+    parser_journal = subparsers.add_parser("to-journal", help="copy shipments from json file into journal directory")
+    parser_journal.add_argument("json_file", nargs="?", default=default_json_filename)
+    parser_journal.add_argument("directory", nargs="?", default=default_journal_directory)
+
+    parser_compact = subparsers.add_parser("compact", help="fold journal of a journal directory into its snapshot")
+    parser_compact.add_argument("directory", nargs="?", default=default_journal_directory)
+
+    parser_convert = subparsers.add_parser("convert", help="copy json file to other (eg compressed) json file")
+    parser_convert.add_argument("json_file")
+    parser_convert.add_argument("new_json_file", help="*.json, *.json.gz or *.json.zst")
+
+    parser_measure = subparsers.add_parser("measure", help="compare size and load time of json file versions")
+    parser_measure.add_argument("json_file", nargs="?", default=default_json_filename)
+
+    args = parser.parse_args()
+
+    if args.command == "to-sqlite":
+        no_migrated = migrate_json_to_sqlite(args.json_file, args.sqlite_file)
+        print(f"migrated {no_migrated} shipment(s) from \"{args.json_file}\" to \"{args.sqlite_file}\"")
+    elif args.command == "to-shards":
+        no_migrated, no_shards = migrate_json_to_shards(args.json_file, args.directory, args.shards)
+        print(f"migrated {no_migrated} shipment(s) from \"{args.json_file}\" to \"{args.directory}\" "
+              f"({no_shards} shards)")
+    elif args.command == "to-journal":
+        no_migrated = migrate_json_to_journal(args.json_file, args.directory)
+        print(f"migrated {no_migrated} shipment(s) from \"{args.json_file}\" to \"{args.directory}\"")
+    elif args.command == "compact":
+        JournaledJsonStorage(args.directory).compact()
+        print(f"compacted \"{args.directory}\"")
+    elif args.command == "convert":
+        from dhl_shipment_status_checker import ShipmentDescriptor
+
+        shipments = [ShipmentDescriptor(shipment_json) for shipment_json in JsonFileStorage(args.json_file).load()]
+        JsonFileStorage(args.new_json_file).save(shipments)
+        print(f"converted {len(shipments)} shipment(s) from \"{args.json_file}\" to \"{args.new_json_file}\"")
+    elif args.command == "measure":
+        for name, size, load_time in measure_json_formats(args.json_file):
+            print(f"{name:<25} {size / 1024:10.1f} KiB {load_time * 1000:10.1f} ms")
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+
+"""
+metrics of DhlShipmentChecker: api latency, http status codes, bytes received,
+load/save/diff durations and number of diffed events
+
+DhlShipmentChecker(..., metrics=TrackerMetrics()) - default None, then nothing is measured
+after a run metrics can be written as prometheus text file (eg for node_exporter textfile collector)
+or as json summary
+
+    metrics.write_prometheus("tracker.prom")
+    metrics.write_json("tracker_metrics.json")
+"""
+
+# upper bounds in seconds, +Inf is added on export
+latency_buckets = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+duration_buckets = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one: +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self):
+        # prometheus buckets count all values <= upper bound
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count > 0 else None,
+            "buckets": {str(bound): count for bound, count in
+                        zip(self.buckets + ["+Inf"], self.get_cumulative_counts())},
+        }
+
+
+class TrackerMetrics:
+    def __init__(self, prefix="dhl_tracker"):
+        self.prefix = prefix
+        # api calls run in parallel
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+        self.api_latency = Histogram(latency_buckets)
+        self.api_status_counts = {}  # "200"/"404"/"none" (request failed) -> count
+        self.api_bytes_received = 0
+        self.load_duration = Histogram(duration_buckets)
+        self.save_duration = Histogram(duration_buckets)
+        self.diff_duration = Histogram(duration_buckets)
+        self.events_diffed = 0
+        self.new_events = 0
+
+    def record_api_call(self, seconds, status_code, no_bytes):
+        with self.lock:
+            self.api_latency.observe(seconds)
+            status = str(status_code).lower()
+            self.api_status_counts[status] = self.api_status_counts.get(status, 0) + 1
+            self.api_bytes_received += no_bytes
+
+    def record_load(self, seconds):
+        with self.lock:
+            self.load_duration.observe(seconds)
+
+    def record_save(self, seconds):
+        with self.lock:
+            self.save_duration.observe(seconds)
+
+    def record_diff(self, seconds, no_events, no_new_events):
+        with self.lock:
+            self.diff_duration.observe(seconds)
+            self.events_diffed += no_events
+            self.new_events += no_new_events
+
+    def get_summary_json(self):
+        with self.lock:
+            return {
+                "since": self.start_time,
+                "api_latency_seconds": self.api_latency.to_json(),
+                "api_responses": dict(self.api_status_counts),
+                "api_bytes_received": self.api_bytes_received,
+                "load_seconds": self.load_duration.to_json(),
+                "save_seconds": self.save_duration.to_json(),
+                "diff_seconds": self.diff_duration.to_json(),
+                "events_diffed": self.events_diffed,
+                "new_events": self.new_events,
+            }
+
+    def get_prometheus_text(self):
+        lines = []
+
+        def add_counter(name, help_text, value, labels=""):
+            if not any(line.startswith(f"# TYPE {name} ") for line in lines):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{labels} {value}")
+
+        def add_histogram(name, help_text, histogram):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(histogram.buckets + ["+Inf"], histogram.get_cumulative_counts()):
+                lines.append(f"{name}_bucket{{le=\"{bound}\"}} {count}")
+            lines.append(f"{name}_sum {histogram.sum}")
+            lines.append(f"{name}_count {histogram.count}")
+
+        p = self.prefix
+        with self.lock:
+            add_histogram(f"{p}_api_latency_seconds", "duration of api calls incl. retries", self.api_latency)
+            for status, count in sorted(self.api_status_counts.items()):
+                add_counter(f"{p}_api_responses_total", "api responses by http status", count,
+                            f"{{status=\"{status}\"}}")
+            add_counter(f"{p}_api_bytes_received_total", "bytes of api response bodies", self.api_bytes_received)
+            add_histogram(f"{p}_load_seconds", "duration of loading shipments from storage", self.load_duration)
+            add_histogram(f"{p}_save_seconds", "duration of saving shipments to storage", self.save_duration)
+            add_histogram(f"{p}_diff_seconds", "duration of comparing a response with known events",
+                          self.diff_duration)
+            add_counter(f"{p}_events_diffed_total", "events in responses compared with known events",
+                        self.events_diffed)
+            add_counter(f"{p}_new_events_total", "events not known before", self.new_events)
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        # atomic, textfile collectors must never see half a file
+        self.write_atomic(filename, self.get_prometheus_text())
+
+    def write_json(self, filename):
+        self.write_atomic(filename, json.dumps(self.get_summary_json(), indent=4))
+
+    def write_atomic(self, filename, text):
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as outfile:
+            outfile.write(text)
+        os.replace(tmp_filename, filename)
+
+    def write(self, filename):
+        # format by file extension: *.prom - prometheus text, otherwise json
+        if filename.endswith(".prom"):
+            self.write_prometheus(filename)
+        else:
+            self.write_json(filename)